@@ -8,13 +8,35 @@ Flask-based web app for detecting emotions from facial images
 import os
 os.environ['KERAS_BACKEND'] = 'jax'
 
-from flask import Flask, render_template, request, jsonify
-from keras.models import load_model
-from keras.preprocessing import image
+from profiling import StartupReport, SamplingProfiler, ProfileStore
+startup_report = StartupReport()
+
+from flask import Flask, render_template, request, jsonify, Response, stream_with_context
+from werkzeug.exceptions import RequestEntityTooLarge
 import numpy as np
-import sqlite3
+import cv2
+import json
+import random
+import tempfile
+import threading
+import time
+import hmac
 from datetime import datetime
-from werkzeug.utils import secure_filename
+from image_decode import decode_grayscale, ImageTooLargeError
+from upload_store import UploadStore
+from history_store import HistoryStore
+import model_registry
+import cascade
+from video_analysis import (
+    VIDEO_EXTENSIONS, open_video, iter_video_frames, iter_image_frames, iter_batches, EmotionTimeline
+)
+import keras
+from keras.models import load_model
+startup_report.mark('imports')
+
+# Create the JAX backend's devices now rather than inside the first request
+keras.ops.zeros((1,))
+startup_report.mark('backend_init')
 
 app = Flask(__name__)
 
@@ -25,66 +47,390 @@ MAX_FILE_SIZE = 16 * 1024 * 1024  # 16MB
 app.config['UPLOAD_FOLDER'] = UPLOAD_FOLDER
 app.config['MAX_CONTENT_LENGTH'] = MAX_FILE_SIZE
 
+# Upload retention: uploads are stored once per content digest and evicted in
+# the background when older than the age quota or over the size quota
+UPLOAD_MAX_BYTES = int(os.environ.get('UPLOAD_MAX_MB', 1024)) * 1024 * 1024
+UPLOAD_MAX_AGE_SECONDS = int(os.environ.get('UPLOAD_MAX_AGE_DAYS', 30)) * 24 * 3600
+UPLOAD_EVICTION_INTERVAL = int(os.environ.get('UPLOAD_EVICTION_INTERVAL', 600))  # seconds
+THUMBNAIL_SIZE = int(os.environ.get('THUMBNAIL_SIZE', 256))  # 0 serves originals
+
+# Prediction history: raw rows are kept in monthly partition files for
+# HISTORY_RAW_RETENTION_DAYS (0 keeps them forever), then rolled up into daily
+# per-emotion counts in DATABASE_PATH
+DATABASE_PATH = 'database.db'
+HISTORY_DIR = os.environ.get('HISTORY_DIR', 'history')
+HISTORY_RAW_RETENTION_DAYS = int(os.environ.get('HISTORY_RAW_RETENTION_DAYS', 90))
+HISTORY_MAINTENANCE_INTERVAL = int(os.environ.get('HISTORY_MAINTENANCE_INTERVAL', 3600))  # seconds
+
 # Emotion labels (must match training order)
 EMOTIONS = ['Angry', 'Disgust', 'Fear', 'Happy', 'Sad', 'Surprise', 'Neutral']
-
-# Load model
+IMG_SIZE = 48
+
+# Face detection configuration
+# The cascade runs on a copy downscaled so its longest side is at most
+# FACE_DETECTION_MAX_DIM pixels, which bounds detector cost per upload.
+FACE_CASCADE_PATH = os.environ.get(
+    'FACE_CASCADE_PATH',
+    os.path.join(cv2.data.haarcascades, 'haarcascade_frontalface_default.xml')
+)
+FACE_DETECTION_MAX_DIM = int(os.environ.get('FACE_DETECTION_MAX_DIM', 640))
+FACE_MIN_SIZE = 24       # Minimum face size (pixels) in the detection image
+FACE_CROP_MARGIN = 0.1   # Extra border around each box, as a fraction of its size
+MAX_FACES = 20           # Cap on faces classified per image
+
+# Video analysis configuration
+# Videos are spooled to a temp file and decoded frame by frame, so they get
+# their own upload limit instead of the image MAX_FILE_SIZE
+MAX_VIDEO_SIZE = int(os.environ.get('MAX_VIDEO_MB', 512)) * 1024 * 1024
+VIDEO_BATCH_SIZE = 32        # Frames per model.predict call
+MAX_VIDEO_BATCH_SIZE = 256
+MAX_VIDEO_FRAMES = int(os.environ.get('MAX_VIDEO_FRAMES', 5000))  # Sampled frames per request
+VIDEO_SMOOTHING = 0.3        # EMA weight of the newest frame in the timeline
+
+# Model registry: workers poll models/ACTIVE and hot-swap when it changes
+MODEL_WATCH_INTERVAL = int(os.environ.get('MODEL_WATCH_INTERVAL', 5))  # seconds, 0 disables
+MODEL_RETRY_MAX_INTERVAL = 300  # seconds; cap on the backoff when no model could be loaded
+ADMIN_TOKEN = os.environ.get('ADMIN_TOKEN')  # Admin endpoints are disabled when unset
+
+# Cascade mode: a small fast model answers confident faces, the rest go to the full model
+CASCADE_MODE = os.environ.get('CASCADE_MODE', '0').lower() in ('1', 'true', 'yes')
+
+# Request profiling: admins can profile a /predict call with an `X-Profile: 1`
+# header or `?profile=1`. PROFILE_SAMPLE_RATE also profiles that fraction of all
+# /predict calls, keeping those slower than PROFILE_SLOW_MS.
+PROFILE_SAMPLE_RATE = float(os.environ.get('PROFILE_SAMPLE_RATE', 0))
+PROFILE_SLOW_MS = float(os.environ.get('PROFILE_SLOW_MS', 500))
+profile_store = ProfileStore()
+
+def warm_up(loaded):
+    """Run one prediction so compilation happens before the first request"""
+    loaded.predict(np.zeros((1, IMG_SIZE, IMG_SIZE, 1), dtype='float32'), verbose=0)
+
+def record_good_version(version):
+    """Remember a version that loaded, for the startup fallback; never fails the load"""
+    try:
+        model_registry.set_last_good_version(version)
+    except OSError as e:
+        print(f"⚠️  Could not record model {version} as last good: {e}")
+
+def load_model_version(version):
+    """Load a model version and run one warm-up prediction"""
+    loaded = load_model(model_registry.model_path(version))
+    warm_up(loaded)
+    return loaded
+
+def serving_candidates():
+    """Versions to try at startup: the active one, the last one that loaded, then the legacy model"""
+    candidates = []
+    for version in (model_registry.get_active_version(), model_registry.get_last_good_version(),
+                    model_registry.LEGACY_VERSION):
+        if version and version not in candidates:
+            candidates.append(version)
+    return candidates
+
+# Load model, falling back when the active version cannot be loaded
 print("🔄 Loading emotion detection model...")
-try:
-    model = load_model('face_emotionModel.h5')
-    print("✅ Model loaded successfully!")
-except Exception as e:
-    print(f"❌ Error loading model: {e}")
-    model = None
+model = None
+startup_failures = {}
+for model_version in serving_candidates():
+    try:
+        model = load_model(model_registry.model_path(model_version))
+        startup_report.mark('model_load')
+        warm_up(model)
+        startup_report.mark('warmup')
+        print(f"✅ Model {model_version} loaded successfully!")
+        break
+    except Exception as e:
+        print(f"❌ Error loading model {model_version}: {e}")
+        startup_failures[model_version] = str(e)
+        model = None
+if model is None:
+    model_version = serving_candidates()[0]
+else:
+    record_good_version(model_version)
+
+upload_store = UploadStore(
+    UPLOAD_FOLDER, '/static/uploads',
+    max_bytes=UPLOAD_MAX_BYTES,
+    max_age_seconds=UPLOAD_MAX_AGE_SECONDS,
+    thumbnail_size=THUMBNAIL_SIZE,
+    eviction_interval=UPLOAD_EVICTION_INTERVAL
+)
+
+history_store = HistoryStore(
+    DATABASE_PATH, HISTORY_DIR,
+    raw_retention_days=HISTORY_RAW_RETENTION_DAYS,
+    maintenance_interval=HISTORY_MAINTENANCE_INTERVAL
+)
+
+def load_cascade(version):
+    """Load the fast model and threshold calibrated against a full model version
+
+    Returns (fast_model, threshold, stamp). fast_model is None when cascade
+    mode is off or the version has no usable calibration; stamp identifies the
+    calibration file so the watcher can pick up a re-run of `--fast`.
+    """
+    if not CASCADE_MODE:
+        return None, None, None
+    stamp = cascade.config_stamp(version)
+    try:
+        threshold = cascade.load_config(version)['threshold']
+        loaded = load_model(cascade.fast_model_path(version))
+        warm_up(loaded)
+        print(f"✅ Cascade mode on for {version} (fast model threshold {threshold:.3f})")
+        return loaded, threshold, stamp
+    except Exception as e:
+        print(f"⚠️  Cascade disabled for {version}, could not load its fast model: {e}")
+        return None, None, stamp
+
+# Load the cascade's first-stage model and its calibrated threshold
+cascade_stats = {'fast': 0, 'full': 0}
+fast_model, fast_threshold, cascade_stamp = load_cascade(model_version) if model is not None else (None, None, None)
+if CASCADE_MODE:
+    startup_report.mark('cascade_model_load')
+
+# Keras model.predict is not safe to call from several threads at once. The
+# same lock guards swapping in a new model, so a swap waits for the prediction
+# in progress and every later prediction uses the new model.
+model_lock = threading.Lock()
+
+# Background model swaps; at most one load runs at a time. An active version
+# that failed to load at startup counts as failed, so the watcher does not
+# retry it until ACTIVE changes.
+model_swap = {'loading': None, 'failed': None, 'error': None, 'swapped_at': None}
+model_swap_lock = threading.Lock()
+_active_at_startup = model_registry.get_active_version()
+if _active_at_startup in startup_failures and model is not None:
+    model_swap.update(failed=_active_at_startup, error=startup_failures[_active_at_startup])
+    print(f"⚠️  Active model {_active_at_startup} failed to load; serving {model_version} instead")
+
+def _load_and_swap(version, activate=False):
+    """Load and warm a model version and its cascade, then atomically make them the serving models
+
+    Swapping to the version already served only reloads its cascade, unless
+    no model is loaded, in which case it is loaded from scratch. With
+    activate=True the registry's ACTIVE file is pointed at the version only
+    once it has loaded, so a broken version never becomes active.
+    """
+    global model, model_version, fast_model, fast_threshold, cascade_stamp
+    try:
+        new_model = model if version == model_version and model is not None else load_model_version(version)
+        new_cascade = load_cascade(version)
+        with model_lock:
+            model, model_version = new_model, version
+            fast_model, fast_threshold, cascade_stamp = new_cascade
+        record_good_version(version)
+        if activate:
+            model_registry.set_active_version(version)
+        model_swap.update(failed=None, error=None, swapped_at=datetime.now().isoformat())
+        print(f"✅ Swapped in model {version}")
+    except Exception as e:
+        model_swap.update(failed=version, error=str(e))
+        print(f"❌ Error loading model {version}: {e}")
+    finally:
+        with model_swap_lock:
+            model_swap['loading'] = None
+
+def start_model_swap(version, activate=False):
+    """Start loading a model version in the background; False if a load is already running"""
+    with model_swap_lock:
+        if model_swap['loading'] is not None:
+            return False
+        model_swap['loading'] = version
+    threading.Thread(target=_load_and_swap, args=(version, activate), name='model-swap', daemon=True).start()
+    return True
+
+def _watch_active_version():
+    """Poll the registry's ACTIVE file and swap when it names a different version
+
+    While no model is loaded (every startup candidate failed, e.g. on a
+    transient I/O error) the startup candidates are retried in turn with
+    exponential backoff. In cascade mode a changed calibration for the
+    serving version reloads the fast model and threshold.
+    """
+    retries, next_retry = 0, 0.0
+    while True:
+        time.sleep(MODEL_WATCH_INTERVAL)
+        try:
+            active = model_registry.get_active_version()
+            if model is None:
+                if model_swap['loading'] is None and time.monotonic() >= next_retry:
+                    candidates = serving_candidates()
+                    if start_model_swap(candidates[retries % len(candidates)]):
+                        retries += 1
+                        next_retry = time.monotonic() + min(
+                            MODEL_RETRY_MAX_INTERVAL, MODEL_WATCH_INTERVAL * 2 ** retries
+                        )
+                continue
+            retries, next_retry = 0, 0.0
+            if active and active != model_version and active != model_swap['failed']:
+                start_model_swap(active)
+            elif CASCADE_MODE and model is not None and cascade.config_stamp(model_version) != cascade_stamp:
+                start_model_swap(model_version)
+        except Exception as e:
+            print(f"Model watch error: {e}")
+
+if MODEL_WATCH_INTERVAL > 0:
+    threading.Thread(target=_watch_active_version, name='model-watch', daemon=True).start()
+
+# Load face detector. CascadeClassifier.detectMultiScale is not safe to call
+# from several threads at once, so each request / decode thread lazily loads
+# its own classifier; this first load only checks the cascade file.
+face_cascade_loaded = not cv2.CascadeClassifier(FACE_CASCADE_PATH).empty()
+if not face_cascade_loaded:
+    print(f"⚠️  Could not load face cascade from {FACE_CASCADE_PATH}, using whole image")
+face_cascades = threading.local()
+startup_report.mark('face_detector')
+
+def get_face_cascade():
+    """This thread's face classifier, or None when the cascade could not be loaded"""
+    if not face_cascade_loaded:
+        return None
+    classifier = getattr(face_cascades, 'classifier', None)
+    if classifier is None:
+        classifier = face_cascades.classifier = cv2.CascadeClassifier(FACE_CASCADE_PATH)
+    return classifier
 
 def init_db():
-    """Initialize SQLite database"""
-    conn = sqlite3.connect('database.db')
-    cursor = conn.cursor()
-
-    # Create table with more fields
-    cursor.execute('''
-        CREATE TABLE IF NOT EXISTS emotions (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            emotion TEXT NOT NULL,
-            confidence REAL,
-            filename TEXT,
-            timestamp DATETIME DEFAULT CURRENT_TIMESTAMP
-        )
-    ''')
-
-    conn.commit()
-    conn.close()
+    """Initialize the history store, moving rows from an older single-table database"""
+    history_store.init()
     print("✅ Database initialized")
 
 def allowed_file(filename):
     """Check if file extension is allowed"""
     return '.' in filename and filename.rsplit('.', 1)[1].lower() in ALLOWED_EXTENSIONS
 
+def detect_faces(gray):
+    """Locate faces in a grayscale image, returning (x, y, w, h) boxes in its coordinates"""
+    face_cascade = get_face_cascade()
+    if face_cascade is None:
+        return []
+
+    # Run the detector on a downscaled copy to bound its cost
+    height, width = gray.shape[:2]
+    scale = min(1.0, FACE_DETECTION_MAX_DIM / float(max(height, width)))
+    if scale < 1.0:
+        small = cv2.resize(gray, (int(width * scale), int(height * scale)),
+                           interpolation=cv2.INTER_AREA)
+    else:
+        small = gray
+
+    small = cv2.equalizeHist(small)
+    detections = face_cascade.detectMultiScale(
+        small,
+        scaleFactor=1.1,
+        minNeighbors=5,
+        minSize=(FACE_MIN_SIZE, FACE_MIN_SIZE)
+    )
+
+    # Map boxes back to full-resolution coordinates, largest faces first
+    boxes = [
+        (int(x / scale), int(y / scale), int(w / scale), int(h / scale))
+        for (x, y, w, h) in detections
+    ]
+    boxes.sort(key=lambda box: box[2] * box[3], reverse=True)
+    return boxes[:MAX_FACES]
+
+def crop_faces(gray, boxes):
+    """Crop each box (with margin) and stack the crops into a normalized model batch"""
+    height, width = gray.shape[:2]
+    crops = []
+    for (x, y, w, h) in boxes:
+        margin_x = int(w * FACE_CROP_MARGIN)
+        margin_y = int(h * FACE_CROP_MARGIN)
+        x0, y0 = max(0, x - margin_x), max(0, y - margin_y)
+        x1, y1 = min(width, x + w + margin_x), min(height, y + h + margin_y)
+        face = cv2.resize(gray[y0:y1, x0:x1], (IMG_SIZE, IMG_SIZE),
+                          interpolation=cv2.INTER_AREA)
+        crops.append(face)
+
+    batch = np.stack(crops).astype('float32') / 255.0  # Normalize
+    return batch.reshape(-1, IMG_SIZE, IMG_SIZE, 1)
+
+def preprocess_gray(gray, scale=1.0, max_faces=MAX_FACES):
+    """Turn a grayscale array into a (batch, boxes) pair of face crops
+
+    Falls back to the whole image with box None when no face is found. Boxes
+    are multiplied by scale to map them to original image coordinates.
+    """
+    boxes = detect_faces(gray)[:max_faces]
+    if boxes:
+        original_boxes = [
+            tuple(int(round(v * scale)) for v in box)
+            for box in boxes
+        ]
+        return crop_faces(gray, boxes), original_boxes
+
+    height, width = gray.shape[:2]
+    return crop_faces(gray, [(0, 0, width, height)]), [None]
+
 def preprocess_image(img_path):
-    """Preprocess image for model prediction"""
+    """Preprocess image for model prediction
+
+    Returns a (batch, boxes) pair with one 48x48 crop per detected face. If no
+    face is found the whole image is used as a single entry with box None.
+    Boxes are in original image coordinates.
+    """
     try:
-        # Load image in grayscale
-        img = image.load_img(img_path, target_size=(48, 48), color_mode='grayscale')
-        img_array = image.img_to_array(img)
-        img_array = img_array / 255.0  # Normalize
-        img_array = np.expand_dims(img_array, axis=0)
-        return img_array
+        # Decode in grayscale at no more than the detector resolution
+        gray, scale = decode_grayscale(img_path, FACE_DETECTION_MAX_DIM)
+        return preprocess_gray(gray, scale)
+    except ImageTooLargeError:
+        raise
     except Exception as e:
         print(f"Error preprocessing image: {e}")
+        return None, None
+
+def box_to_dict(box):
+    """Convert an (x, y, w, h) box to its JSON form"""
+    if box is None:
         return None
+    return {'x': box[0], 'y': box[1], 'width': box[2], 'height': box[3]}
+
+def run_model(batch, **kwargs):
+    """Run model.predict on a batch, one call at a time
+
+    Returns (predictions, model_version) so callers can record which model
+    produced the result even if a swap happens right after. In cascade mode
+    the version is suffixed with "+cascade@<threshold>".
+    """
+    with model_lock:
+        if fast_model is None:
+            return model.predict(batch, verbose=0, **kwargs), model_version
+
+        predictions, escalated = cascade.cascade_predict(
+            fast_model, model, batch, fast_threshold, **kwargs
+        )
+        escalated_count = int(escalated.sum())
+        cascade_stats['full'] += escalated_count
+        cascade_stats['fast'] += len(batch) - escalated_count
+        return predictions, f'{model_version}+cascade@{fast_threshold:.3f}'
+
+def classify_faces(batch, boxes):
+    """Run all faces from one image through the model as a single batch
+
+    Returns (faces, model_version).
+    """
+    predictions, version = run_model(batch)
+
+    faces = []
+    for box, prediction in zip(boxes, predictions):
+        emotion_idx = int(np.argmax(prediction))
+        faces.append({
+            'box': box_to_dict(box),
+            'emotion': EMOTIONS[emotion_idx],
+            'confidence': float(prediction[emotion_idx]) * 100,
+            'all_emotions': {
+                EMOTIONS[i]: float(prediction[i]) * 100
+                for i in range(len(EMOTIONS))
+            }
+        })
+    return faces, version
 
-def save_to_database(emotion, confidence, filename):
+def save_to_database(emotion, confidence, filename, model_version=None):
     """Save prediction result to database"""
     try:
-        conn = sqlite3.connect('database.db')
-        cursor = conn.cursor()
-        cursor.execute(
-            "INSERT INTO emotions (emotion, confidence, filename) VALUES (?, ?, ?)",
-            (emotion, confidence, filename)
-        )
-        conn.commit()
-        conn.close()
+        history_store.add(emotion, confidence, filename, model_version)
         return True
     except Exception as e:
         print(f"Database error: {e}")
@@ -95,86 +441,326 @@ def home():
     """Render home page"""
     return render_template('index.html')
 
+def validate_upload(file):
+    """Check that a prediction can run on this upload
+
+    Returns an (error_payload, status) pair, or None if the upload is acceptable.
+    """
+    # Check if model is loaded
+    if model is None:
+        return {
+            'success': False,
+            'error': 'Model not loaded. Please ensure face_emotionModel.h5 exists.'
+        }, 500
+
+    # Check if file is in request
+    if file is None:
+        return {
+            'success': False,
+            'error': 'No file uploaded'
+        }, 400
+
+    # Check if file is selected
+    if file.filename == '':
+        return {
+            'success': False,
+            'error': 'No file selected'
+        }, 400
+
+    # Check file extension
+    if not allowed_file(file.filename):
+        return {
+            'success': False,
+            'error': f'Invalid file type. Allowed types: {", ".join(ALLOWED_EXTENSIONS)}'
+        }, 400
+
+    return None
+
+def predict_saved_image(stored):
+    """Classify every face in a stored upload and record the results
+
+    Returns a (payload, status) pair in the /predict JSON contract.
+    """
+    # Preprocess image into one crop per detected face
+    try:
+        batch, boxes = preprocess_image(stored.path)
+    except ImageTooLargeError as e:
+        return {
+            'success': False,
+            'error': f'{e}. Please upload a smaller image.'
+        }, 413
+    if batch is None:
+        return {
+            'success': False,
+            'error': 'Error processing image'
+        }, 500
+
+    # Make prediction for every face in a single batch
+    faces, version = classify_faces(batch, boxes)
+
+    # Save each face to database
+    for face in faces:
+        save_to_database(face['emotion'], face['confidence'], stored.name, version)
+
+    # Return result; top-level fields describe the largest face
+    primary = faces[0]
+    return {
+        'success': True,
+        'emotion': primary['emotion'],
+        'confidence': round(primary['confidence'], 2),
+        'all_emotions': {k: round(v, 2) for k, v in primary['all_emotions'].items()},
+        'face_detected': primary['box'] is not None,
+        'face_count': sum(1 for face in faces if face['box'] is not None),
+        'faces': [
+            {
+                'box': face['box'],
+                'emotion': face['emotion'],
+                'confidence': round(face['confidence'], 2),
+                'all_emotions': {k: round(v, 2) for k, v in face['all_emotions'].items()}
+            }
+            for face in faces
+        ],
+        'image_url': upload_store.thumbnail_url(stored),
+        'model_version': version
+    }, 200
+
+def profiling_requested(headers, args):
+    """True when a request carries the profile flag and a valid admin token"""
+    flag = (headers.get('X-Profile') or args.get('profile') or '').lower()
+    if flag not in ('1', 'true', 'yes') or not ADMIN_TOKEN:
+        return False
+    return hmac.compare_digest(headers.get('X-Admin-Token', ''), ADMIN_TOKEN)
+
+def run_profiled(path, requested, fn, *args):
+    """Call fn(*args) under the sampling profiler when requested or sampled
+
+    Returns (result, profile_id); profile_id is None unless a profile was stored.
+    """
+    if not requested and not (PROFILE_SAMPLE_RATE and random.random() < PROFILE_SAMPLE_RATE):
+        return fn(*args), None
+
+    with SamplingProfiler() as profiler:
+        result = fn(*args)
+
+    if requested or profiler.duration * 1000 >= PROFILE_SLOW_MS:
+        return result, profile_store.add(path, profiler, requested=requested, model_version=model_version)
+    return result, None
+
+def save_and_predict(file):
+    """Store an upload by content digest and classify it"""
+    # Identical uploads share one file
+    stored = upload_store.save(file.stream, file.filename)
+    return predict_saved_image(stored)
+
 @app.route('/predict', methods=['POST'])
 def predict():
     """Handle emotion prediction from uploaded image"""
     try:
-        # Check if model is loaded
+        file = request.files.get('file')
+        error = validate_upload(file)
+        if error is not None:
+            payload, status = error
+            return jsonify(payload), status
+
+        requested = profiling_requested(request.headers, request.args)
+        (payload, status), profile_id = run_profiled('/predict', requested, save_and_predict, file)
+
+        response = jsonify(payload)
+        if requested and profile_id:
+            response.headers['X-Profile-Id'] = profile_id
+        return response, status
+
+    except Exception as e:
+        print(f"Prediction error: {e}")
+        import traceback
+        traceback.print_exc()
+        return jsonify({
+            'success': False,
+            'error': f'Server error: {str(e)}'
+        }), 500
+
+def _int_param(name, default, minimum, maximum):
+    """Read an integer form/query parameter clamped to [minimum, maximum]"""
+    value = request.values.get(name)
+    if value in (None, ''):
+        return default
+    return min(maximum, max(minimum, int(value)))
+
+def _float_param(name, default):
+    """Read an optional float form/query parameter"""
+    value = request.values.get(name)
+    if value in (None, ''):
+        return default
+    return float(value)
+
+def analyze_frames(frames, batch_size, smoothing):
+    """Classify sampled frames in batches, yielding NDJSON result lines
+
+    Each frame is represented by its largest face (or the whole frame when no
+    face is found). Lines are emitted per frame, per finished timeline segment
+    and once for the final summary.
+    """
+    timeline = EmotionTimeline(EMOTIONS, alpha=smoothing)
+    version = None
+
+    for chunk in iter_batches(frames, batch_size):
+        crops, boxes = [], []
+        for _, _, gray, scale in chunk:
+            crop, frame_boxes = preprocess_gray(gray, scale, max_faces=1)
+            crops.append(crop)
+            boxes.append(frame_boxes[0])
+
+        predictions, version = run_model(np.concatenate(crops))
+
+        for (frame_index, timestamp, _, _), box, prediction in zip(chunk, boxes, predictions):
+            emotion_idx = int(np.argmax(prediction))
+            smoothed, closed = timeline.update(frame_index, timestamp, prediction)
+            smoothed_idx = int(np.argmax(smoothed))
+
+            if closed is not None:
+                yield json.dumps({'type': 'segment', **closed}) + '\n'
+
+            yield json.dumps({
+                'type': 'frame',
+                'frame': frame_index,
+                'time': None if timestamp is None else round(timestamp, 3),
+                'face_detected': box is not None,
+                'box': box_to_dict(box),
+                'emotion': EMOTIONS[emotion_idx],
+                'confidence': round(float(prediction[emotion_idx]) * 100, 2),
+                'smoothed_emotion': EMOTIONS[smoothed_idx],
+                'smoothed': {
+                    EMOTIONS[i]: round(float(smoothed[i]) * 100, 2)
+                    for i in range(len(EMOTIONS))
+                }
+            }) + '\n'
+
+    closed, summary = timeline.finish()
+    if closed is not None:
+        yield json.dumps({'type': 'segment', **closed}) + '\n'
+    if 'dominant_confidence' in summary:
+        summary['dominant_confidence'] = round(summary['dominant_confidence'], 2)
+    yield json.dumps({'type': 'summary', 'success': True, 'model_version': version, **summary}) + '\n'
+
+@app.route('/predict_video', methods=['POST'])
+def predict_video():
+    """Stream per-frame emotions and a smoothed timeline for a video or frame sequence
+
+    Accepts either a video file in the `file` field or a sequence of images in
+    repeated `frames` fields. Optional parameters: `every_n` (sample every Nth
+    frame), `fps` (sample at a fixed rate; timestamps frame sequences),
+    `batch_size`, `max_frames` and `smoothing` (EMA weight of the newest frame).
+    """
+    # Must be set before anything reads the form
+    request.max_content_length = MAX_VIDEO_SIZE
+    try:
         if model is None:
             return jsonify({
                 'success': False,
                 'error': 'Model not loaded. Please ensure face_emotionModel.h5 exists.'
             }), 500
 
-        # Check if file is in request
-        if 'file' not in request.files:
+        try:
+            frame_files = [f for f in request.files.getlist('frames') if f.filename]
+        except RequestEntityTooLarge:
             return jsonify({
                 'success': False,
-                'error': 'No file uploaded'
-            }), 400
-
-        file = request.files['file']
-
-        # Check if file is selected
-        if file.filename == '':
+                'error': f'Upload too large. Maximum size is {MAX_VIDEO_SIZE // (1024 * 1024)}MB.'
+            }), 413
+
+        try:
+            every_n = _int_param('every_n', 1, 1, 10000)
+            target_fps = _float_param('fps', None)
+            batch_size = _int_param('batch_size', VIDEO_BATCH_SIZE, 1, MAX_VIDEO_BATCH_SIZE)
+            max_frames = _int_param('max_frames', MAX_VIDEO_FRAMES, 1, MAX_VIDEO_FRAMES)
+            smoothing = _float_param('smoothing', VIDEO_SMOOTHING)
+        except ValueError:
             return jsonify({
                 'success': False,
-                'error': 'No file selected'
+                'error': 'Invalid numeric parameter'
             }), 400
-
-        # Check file extension
-        if not allowed_file(file.filename):
+        if not 0 < smoothing <= 1 or (target_fps is not None and target_fps <= 0):
             return jsonify({
                 'success': False,
-                'error': f'Invalid file type. Allowed types: {", ".join(ALLOWED_EXTENSIONS)}'
+                'error': 'smoothing must be in (0, 1] and fps must be positive'
             }), 400
 
-        # Create upload folder if it doesn't exist
-        os.makedirs(app.config['UPLOAD_FOLDER'], exist_ok=True)
-
-        # Save file with secure filename
-        filename = secure_filename(file.filename)
-        timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
-        filename = f"{timestamp}_{filename}"
-        filepath = os.path.join(app.config['UPLOAD_FOLDER'], filename)
-        file.save(filepath)
-
-        # Preprocess image
-        img_array = preprocess_image(filepath)
-        if img_array is None:
-            return jsonify({
-                'success': False,
-                'error': 'Error processing image'
-            }), 500
-
-        # Make prediction
-        prediction = model.predict(img_array, verbose=0)
-        emotion_idx = np.argmax(prediction[0])
-        emotion = EMOTIONS[emotion_idx]
-        confidence = float(prediction[0][emotion_idx]) * 100
-
-        # Get all emotion probabilities
-        all_emotions = {
-            EMOTIONS[i]: float(prediction[0][i]) * 100
-            for i in range(len(EMOTIONS))
-        }
-
-        # Save to database
-        save_to_database(emotion, confidence, filename)
-
-        # Return result
-        return jsonify({
-            'success': True,
-            'emotion': emotion,
-            'confidence': round(confidence, 2),
-            'all_emotions': {k: round(v, 2) for k, v in all_emotions.items()},
-            'image_url': f'/static/uploads/{filename}'
-        })
+        video_path = None
+        capture = None
+
+        if frame_files:
+            invalid = [f.filename for f in frame_files if not allowed_file(f.filename)]
+            if invalid:
+                return jsonify({
+                    'success': False,
+                    'error': f'Invalid frame file type. Allowed types: {", ".join(ALLOWED_EXTENSIONS)}'
+                }), 400
+            # Measure the spooled parts before reading any of them, so an
+            # oversized sequence is refused without loading it into memory
+            total_size = 0
+            for f in frame_files:
+                f.stream.seek(0, os.SEEK_END)
+                total_size += f.stream.tell()
+                f.stream.seek(0)
+                if total_size > MAX_FILE_SIZE:
+                    return jsonify({
+                        'success': False,
+                        'error': f'Frame sequence too large. Maximum size is {MAX_FILE_SIZE // (1024 * 1024)}MB; '
+                                 'upload longer recordings as a video file.'
+                    }), 413
+            # Request files are closed before a streamed response finishes, so
+            # keep the encoded bytes (bounded by MAX_FILE_SIZE) and decode lazily
+            encoded_frames = [f.read() for f in frame_files]
+            frames = iter_image_frames(
+                encoded_frames, FACE_DETECTION_MAX_DIM, every_n, target_fps, max_frames
+            )
+        else:
+            if 'file' not in request.files or request.files['file'].filename == '':
+                return jsonify({
+                    'success': False,
+                    'error': 'No video or frames uploaded'
+                }), 400
+
+            file = request.files['file']
+            extension = file.filename.rsplit('.', 1)[-1].lower() if '.' in file.filename else ''
+            if extension not in VIDEO_EXTENSIONS:
+                return jsonify({
+                    'success': False,
+                    'error': f'Invalid video type. Allowed types: {", ".join(sorted(VIDEO_EXTENSIONS))}'
+                }), 400
+
+            # OpenCV needs a real file to decode from
+            fd, video_path = tempfile.mkstemp(suffix=f'.{extension}')
+            os.close(fd)
+            file.save(video_path)
+
+            # Reject unreadable files before the streamed 200 response starts
+            try:
+                capture = open_video(video_path)
+            except ValueError:
+                os.remove(video_path)
+                return jsonify({
+                    'success': False,
+                    'error': 'Could not read video file'
+                }), 400
+            frames = iter_video_frames(capture, FACE_DETECTION_MAX_DIM, every_n, target_fps, max_frames)
+
+        def generate():
+            try:
+                yield from analyze_frames(frames, batch_size, smoothing)
+            except Exception as e:
+                print(f"Video prediction error: {e}")
+                yield json.dumps({'type': 'error', 'success': False, 'error': str(e)}) + '\n'
+            finally:
+                if capture is not None:
+                    capture.release()
+                if video_path is not None and os.path.exists(video_path):
+                    os.remove(video_path)
+
+        return Response(stream_with_context(generate()), mimetype='application/x-ndjson')
 
     except Exception as e:
-        print(f"Prediction error: {e}")
-        import traceback
-        traceback.print_exc()
+        print(f"Video prediction error: {e}")
         return jsonify({
             'success': False,
             'error': f'Server error: {str(e)}'
@@ -184,20 +770,15 @@ def predict():
 def history():
     """Get prediction history from database"""
     try:
-        conn = sqlite3.connect('database.db')
-        cursor = conn.cursor()
-        cursor.execute(
-            "SELECT emotion, confidence, filename, timestamp FROM emotions ORDER BY timestamp DESC LIMIT 50"
-        )
-        rows = cursor.fetchall()
-        conn.close()
+        rows = history_store.recent(50)
 
         history_data = [
             {
                 'emotion': row[0],
                 'confidence': row[1],
                 'filename': row[2],
-                'timestamp': row[3]
+                'timestamp': row[3],
+                'model_version': row[4]
             }
             for row in rows
         ]
@@ -217,15 +798,7 @@ def history():
 def stats():
     """Get emotion statistics"""
     try:
-        conn = sqlite3.connect('database.db')
-        cursor = conn.cursor()
-        cursor.execute(
-            "SELECT emotion, COUNT(*) as count FROM emotions GROUP BY emotion ORDER BY count DESC"
-        )
-        rows = cursor.fetchall()
-        conn.close()
-
-        stats_data = {row[0]: row[1] for row in rows}
+        stats_data = history_store.emotion_counts()
 
         return jsonify({
             'success': True,
@@ -244,16 +817,174 @@ def health():
     return jsonify({
         'status': 'healthy',
         'model_loaded': model is not None,
+        'model_version': model_version,
+        'cascade': None if fast_model is None else {
+            'threshold': fast_threshold,
+            'faces_fast': cascade_stats['fast'],
+            'faces_full': cascade_stats['full']
+        },
         'timestamp': datetime.now().isoformat()
     })
 
+def admin_error():
+    """Reject admin requests unless ADMIN_TOKEN is set and matches X-Admin-Token"""
+    if not ADMIN_TOKEN:
+        return jsonify({
+            'success': False,
+            'error': 'Admin endpoints are disabled. Set ADMIN_TOKEN to enable them.'
+        }), 403
+    if not hmac.compare_digest(request.headers.get('X-Admin-Token', ''), ADMIN_TOKEN):
+        return jsonify({
+            'success': False,
+            'error': 'Invalid admin token'
+        }), 401
+    return None
+
+@app.route('/admin/model', methods=['GET'])
+def admin_model_status():
+    """Report the serving model version, any swap in progress and the registry contents"""
+    error = admin_error()
+    if error is not None:
+        return error
+
+    try:
+        versions = []
+        for version in model_registry.list_versions():
+            try:
+                versions.append(model_registry.get_metadata(version))
+            except (OSError, ValueError):
+                versions.append({'version': version})
+
+        return jsonify({
+            'success': True,
+            'model_version': model_version,
+            'registry_active': model_registry.get_active_version(),
+            'loading': model_swap['loading'],
+            'last_error': model_swap['error'],
+            'swapped_at': model_swap['swapped_at'],
+            'versions': versions
+        })
+
+    except Exception as e:
+        return jsonify({
+            'success': False,
+            'error': str(e)
+        }), 500
+
+@app.route('/admin/model', methods=['POST'])
+def admin_model_activate():
+    """Hot-swap a registry version (default: newest) in the background and activate it
+
+    The ACTIVE file is updated once the version has loaded, so other workers
+    pick up the same version through their watcher. If the load fails ACTIVE
+    is left unchanged and GET /admin/model reports the error.
+    """
+    error = admin_error()
+    if error is not None:
+        return error
+
+    try:
+        data = request.get_json(silent=True)
+        version = data.get('version') if isinstance(data, dict) else None
+        if not version:
+            versions = model_registry.list_versions()
+            if not versions:
+                return jsonify({
+                    'success': False,
+                    'error': 'No model versions registered'
+                }), 404
+            version = versions[-1]
+
+        try:
+            model_registry.check_version(version)
+        except ValueError as e:
+            return jsonify({
+                'success': False,
+                'error': str(e)
+            }), 404
+
+        if version == model_version and model is not None:
+            model_registry.set_active_version(version)
+            return jsonify({
+                'success': True,
+                'status': 'active',
+                'version': version
+            })
+
+        if not start_model_swap(version, activate=True):
+            return jsonify({
+                'success': False,
+                'error': f"Model {model_swap['loading']} is already loading"
+            }), 409
+
+        return jsonify({
+            'success': True,
+            'status': 'loading',
+            'version': version
+        }), 202
+
+    except Exception as e:
+        return jsonify({
+            'success': False,
+            'error': str(e)
+        }), 500
+
+@app.route('/admin/profiles', methods=['GET'])
+def admin_profiles():
+    """Recent stored request profiles, slowest first (without full stacks)"""
+    error = admin_error()
+    if error is not None:
+        return error
+
+    try:
+        limit = _int_param('limit', 20, 1, profile_store.max_entries)
+        min_ms = _float_param('min_ms', 0)
+        return jsonify({
+            'success': True,
+            'sample_rate': PROFILE_SAMPLE_RATE,
+            'slow_ms': PROFILE_SLOW_MS,
+            'profiles': profile_store.slowest(limit, min_ms)
+        })
+
+    except Exception as e:
+        return jsonify({
+            'success': False,
+            'error': str(e)
+        }), 500
+
+@app.route('/admin/profiles/<profile_id>', methods=['GET'])
+def admin_profile(profile_id):
+    """One stored profile including its collapsed stacks"""
+    error = admin_error()
+    if error is not None:
+        return error
+
+    profile = profile_store.get(profile_id)
+    if profile is None:
+        return jsonify({
+            'success': False,
+            'error': 'Profile not found'
+        }), 404
+    return jsonify({'success': True, 'profile': profile})
+
+@app.route('/admin/startup', methods=['GET'])
+def admin_startup():
+    """How long each start-up phase of this worker took"""
+    error = admin_error()
+    if error is not None:
+        return error
+
+    return jsonify({'success': True, 'model_version': model_version, **startup_report.as_dict()})
+
+# Create or migrate the history table in every worker, not only under `python app.py`
+init_db()
+startup_report.mark('database')
+startup_report.print()
+
 if __name__ == '__main__':
     # Create necessary directories
     os.makedirs('static/uploads', exist_ok=True)
 
-    # Initialize database
-    init_db()
-
     # Run app
     port = int(os.environ.get('PORT', 5000))
     app.run(host='0.0.0.0', port=port, debug=True)
@@ -0,0 +1,187 @@
+# asgi.py
+"""
+Async serving mode for the emotion detection app
+Request I/O runs on the event loop while decoding and inference run in a
+bounded thread pool. When the pool is saturated /predict answers 503 right
+away instead of tying up a worker. Every other route is served by the Flask
+app unchanged, so URLs and JSON responses are the same as `app:app`.
+
+Run with:
+    uvicorn asgi:app --host 0.0.0.0 --port 5000
+    gunicorn -k uvicorn.workers.UvicornWorker asgi:app
+"""
+
+import asyncio
+import os
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import asynccontextmanager
+
+from a2wsgi import WSGIMiddleware
+from starlette.applications import Starlette
+from starlette.datastructures import UploadFile
+from starlette.exceptions import HTTPException
+from starlette.requests import Request
+from starlette.responses import JSONResponse
+from starlette.routing import Mount, Route
+
+from app import (
+    app as flask_app, MAX_FILE_SIZE,
+    validate_upload, upload_store, predict_saved_image,
+    profiling_requested, run_profiled
+)
+
+# Threads running decode + inference, and the most requests allowed to be
+# running or waiting for one before new ones are turned away
+INFERENCE_WORKERS = int(os.environ.get('INFERENCE_WORKERS', 2))
+INFERENCE_QUEUE_SIZE = int(os.environ.get('INFERENCE_QUEUE_SIZE', 16))
+RETRY_AFTER_SECONDS = 1
+
+
+class ServerBusy(Exception):
+    """Raised when the inference queue is full"""
+
+
+class UploadTooLarge(Exception):
+    """Raised when a request body grows past MAX_FILE_SIZE"""
+
+
+def limit_body(request, max_size):
+    """Return a copy of request whose body raises UploadTooLarge past max_size bytes
+
+    Content-Length is only a claim and is absent for chunked uploads, and
+    Starlette spools file parts to disk without a size cap, so the bytes are
+    counted as they arrive, the way Flask's MAX_CONTENT_LENGTH does.
+    """
+    received = 0
+
+    async def receive():
+        nonlocal received
+        message = await request.receive()
+        if message['type'] == 'http.request':
+            received += len(message.get('body', b''))
+            if received > max_size:
+                raise UploadTooLarge()
+        return message
+
+    return Request(request.scope, receive)
+
+
+class BoundedExecutor:
+    """Thread pool that refuses work once max_pending jobs are queued or running
+
+    The pending count is only touched from the event loop thread, so it needs
+    no locking.
+    """
+
+    def __init__(self, workers, max_pending):
+        self.executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='inference')
+        self.max_pending = max_pending
+        self.pending = 0
+
+    def full(self):
+        return self.pending >= self.max_pending
+
+    async def run(self, fn, *args):
+        if self.full():
+            raise ServerBusy()
+        self.pending += 1
+        try:
+            loop = asyncio.get_running_loop()
+            return await loop.run_in_executor(self.executor, fn, *args)
+        finally:
+            self.pending -= 1
+
+    def shutdown(self):
+        self.executor.shutdown(wait=True)
+
+
+inference = BoundedExecutor(INFERENCE_WORKERS, INFERENCE_QUEUE_SIZE)
+
+
+def busy_response():
+    """503 returned when the inference queue is full"""
+    return JSONResponse({
+        'success': False,
+        'error': 'Server busy. Please retry shortly.'
+    }, status_code=503, headers={'Retry-After': str(RETRY_AFTER_SECONDS)})
+
+
+async def predict(request):
+    """Async /predict: same contract as the Flask view, with inference offloaded"""
+    # Refuse before reading the body when there is no capacity anyway
+    if inference.full():
+        return busy_response()
+
+    try:
+        content_length = request.headers.get('content-length')
+        try:
+            content_length = None if content_length is None else int(content_length)
+        except ValueError:
+            return JSONResponse({
+                'success': False,
+                'error': 'Invalid Content-Length header'
+            }, status_code=400)
+        if content_length is not None and content_length > MAX_FILE_SIZE:
+            return JSONResponse({
+                'success': False,
+                'error': 'File too large. Maximum size is 16MB.'
+            }, status_code=413)
+
+        request = limit_body(request, MAX_FILE_SIZE)
+        async with request.form(max_files=1, max_part_size=MAX_FILE_SIZE) as form:
+            file = form.get('file')
+            if not isinstance(file, UploadFile):
+                file = None
+
+            error = validate_upload(file)
+            if error is not None:
+                payload, status = error
+                return JSONResponse(payload, status_code=status)
+
+            await file.seek(0)
+            stored = await asyncio.to_thread(upload_store.save, file.file, file.filename)
+
+        # Only decode + inference is profiled here; the upload was read on the event loop
+        requested = profiling_requested(request.headers, request.query_params)
+        (payload, status), profile_id = await inference.run(
+            run_profiled, '/predict', requested, predict_saved_image, stored
+        )
+        headers = {'X-Profile-Id': profile_id} if requested and profile_id else None
+        return JSONResponse(payload, status_code=status, headers=headers)
+
+    except ServerBusy:
+        return busy_response()
+    except UploadTooLarge:
+        return JSONResponse({
+            'success': False,
+            'error': 'File too large. Maximum size is 16MB.'
+        }, status_code=413)
+    except HTTPException as e:
+        # Malformed multipart bodies, e.g. more than one file part
+        return JSONResponse({
+            'success': False,
+            'error': e.detail
+        }, status_code=400)
+    except Exception as e:
+        print(f"Prediction error: {e}")
+        import traceback
+        traceback.print_exc()
+        return JSONResponse({
+            'success': False,
+            'error': f'Server error: {str(e)}'
+        }, status_code=500)
+
+
+@asynccontextmanager
+async def lifespan(_app):
+    yield
+    inference.shutdown()
+
+
+app = Starlette(
+    routes=[
+        Route('/predict', predict, methods=['POST']),
+        Mount('/', app=WSGIMiddleware(flask_app)),
+    ],
+    lifespan=lifespan
+)
@@ -0,0 +1,339 @@
+# batch_score.py
+"""
+Bulk offline emotion scoring
+Scores every image under a directory tree, or every row of an emotions.csv-style
+pixel file, with the web app's preprocessing and model. Images are decoded by a
+thread pool while the previous chunk is being scored, and results are streamed
+to CSV, Parquet or SQLite. Progress is checkpointed after every chunk so an
+interrupted job resumes where it stopped.
+
+Usage:
+    python batch_score.py --input photos/ --output scores.csv
+    python batch_score.py --csv data/data/emotions.csv --output scores.db
+    python batch_score.py --input photos/ --output scores.parquet --workers 8 --resume
+"""
+
+import argparse
+import csv
+import json
+import os
+import sqlite3
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+from itertools import islice
+
+import numpy as np
+
+import app
+from app import EMOTIONS, IMG_SIZE, preprocess_image
+from image_decode import ImageTooLargeError
+
+CHUNK_SIZE = 2048       # Items decoded, scored and checkpointed together
+BATCH_SIZE = 512        # Faces per model.predict call
+PROB_COLUMNS = [f'prob_{emotion.lower()}' for emotion in EMOTIONS]
+COLUMN_TYPES = {
+    'item_index': 'INTEGER', 'source': 'TEXT', 'face_index': 'INTEGER',
+    'box_x': 'INTEGER', 'box_y': 'INTEGER', 'box_width': 'INTEGER', 'box_height': 'INTEGER',
+    'label': 'TEXT', 'emotion': 'TEXT', 'confidence': 'REAL', 'model_version': 'TEXT', 'error': 'TEXT',
+    **{column: 'REAL' for column in PROB_COLUMNS}
+}
+COLUMNS = list(COLUMN_TYPES)
+
+
+def iter_image_paths(root):
+    """Yield image paths under root in a stable (sorted) order without listing the whole tree"""
+    for dirpath, dirnames, filenames in os.walk(root):
+        dirnames.sort()
+        for filename in sorted(filenames):
+            if app.allowed_file(filename):
+                yield os.path.join(dirpath, filename)
+
+
+def iter_csv_rows(csv_path):
+    """Yield (source, label, pixels) for each row of an emotions.csv-style file"""
+    with open(csv_path, newline='') as f:
+        for row_number, row in enumerate(csv.DictReader(f)):
+            label = row.get('emotion')
+            if label not in (None, ''):
+                label = EMOTIONS[int(label)]
+            yield f'{os.path.basename(csv_path)}:{row_number}', label, row['pixels']
+
+
+def decode_path(path):
+    """Worker task: preprocess one image file into (batch, boxes, error)"""
+    try:
+        batch, boxes = preprocess_image(path)
+    except ImageTooLargeError as e:
+        return None, None, str(e)
+    if batch is None:
+        return None, None, 'Error processing image'
+    return batch, boxes, None
+
+
+def decode_pixels(pixels):
+    """Worker task: turn a space-separated 48x48 pixel string into a one-face batch"""
+    try:
+        face = np.array(pixels.split(' '), dtype='float32')
+        face = face.reshape(1, IMG_SIZE, IMG_SIZE, 1) / 255.0  # Normalize
+    except ValueError as e:
+        return None, None, str(e)
+    return face, [None], None
+
+
+class CSVWriter:
+    """Append rows to a CSV file; resumes by truncating to the checkpointed offset"""
+
+    def __init__(self, path, resume_state):
+        self.path = path
+        exists = os.path.exists(path)
+        self.file = open(path, 'r+' if exists else 'w', newline='')
+        if resume_state is not None and exists:
+            self.file.truncate(resume_state.get('offset', 0))
+            self.file.seek(0, os.SEEK_END)
+        else:
+            self.file.truncate(0)
+        self.writer = csv.writer(self.file)
+        if self.file.tell() == 0:
+            self.writer.writerow(COLUMNS)
+
+    def write(self, rows):
+        self.writer.writerows([[row[c] for c in COLUMNS] for row in rows])
+        self.file.flush()
+        os.fsync(self.file.fileno())
+
+    def state(self):
+        return {'offset': self.file.tell()}
+
+    def close(self):
+        self.file.close()
+
+
+class SQLiteWriter:
+    """Insert rows into a `scores` table; rows past the checkpoint are dropped on resume"""
+
+    def __init__(self, path, resume_state):
+        self.conn = sqlite3.connect(path)
+        self.conn.execute('PRAGMA journal_mode=WAL')
+        column_defs = ', '.join(f'{c} {t}' for c, t in COLUMN_TYPES.items())
+        if resume_state is None:
+            self.conn.execute('DROP TABLE IF EXISTS scores')
+        self.conn.execute(f'CREATE TABLE IF NOT EXISTS scores ({column_defs})')
+        self.conn.execute('CREATE INDEX IF NOT EXISTS idx_scores_item ON scores (item_index)')
+        if resume_state is not None:
+            self.conn.execute('DELETE FROM scores WHERE item_index >= ?', (resume_state['completed'],))
+        self.conn.commit()
+        self.insert = (
+            f"INSERT INTO scores ({', '.join(COLUMNS)}) "
+            f"VALUES ({', '.join('?' for _ in COLUMNS)})"
+        )
+
+    def write(self, rows):
+        self.conn.executemany(self.insert, [[row[c] for c in COLUMNS] for row in rows])
+        self.conn.commit()
+
+    def state(self):
+        return {}
+
+    def close(self):
+        self.conn.close()
+
+
+class ParquetWriter:
+    """Write one Parquet part file per chunk into an output directory"""
+
+    def __init__(self, path, resume_state):
+        try:
+            import pyarrow as pa
+            import pyarrow.parquet as pq
+        except ImportError:
+            sys.exit('❌ Parquet output requires pyarrow (pip install pyarrow)')
+        self.pa, self.pq = pa, pq
+        self.path = path
+        arrow_types = {'INTEGER': pa.int64(), 'REAL': pa.float64(), 'TEXT': pa.string()}
+        self.schema = pa.schema([(c, arrow_types[t]) for c, t in COLUMN_TYPES.items()])
+        os.makedirs(path, exist_ok=True)
+
+        # Parts at or beyond the checkpoint belong to an unfinished chunk
+        completed = resume_state['completed'] if resume_state is not None else 0
+        for name in os.listdir(path):
+            if name.startswith('part-') and name.endswith('.parquet'):
+                if int(name[5:-8]) >= completed:
+                    os.remove(os.path.join(path, name))
+
+    def write(self, rows):
+        if not rows:
+            return
+        table = self.pa.Table.from_pydict(
+            {c: [row[c] for row in rows] for c in COLUMNS}, schema=self.schema
+        )
+        part = os.path.join(self.path, f"part-{rows[0]['item_index']:012d}.parquet")
+        self.pq.write_table(table, part + '.tmp')
+        os.replace(part + '.tmp', part)
+
+    def state(self):
+        return {}
+
+    def close(self):
+        pass
+
+
+def open_writer(path, resume_state):
+    """Pick an output writer from the file extension"""
+    extension = os.path.splitext(path)[1].lower()
+    if extension == '.csv':
+        return CSVWriter(path, resume_state)
+    if extension in ('.db', '.sqlite', '.sqlite3'):
+        return SQLiteWriter(path, resume_state)
+    if extension == '.parquet':
+        return ParquetWriter(path, resume_state)
+    sys.exit(f'❌ Unsupported output type {extension!r}; use .csv, .parquet or .db')
+
+
+def load_checkpoint(path, job):
+    """Load a checkpoint written for the same job, or None"""
+    if not os.path.exists(path):
+        return None
+    with open(path) as f:
+        checkpoint = json.load(f)
+    if checkpoint.get('job') != job:
+        sys.exit(f'❌ Checkpoint {path} belongs to a different job; remove it or drop --resume')
+    return checkpoint
+
+
+def save_checkpoint(path, checkpoint):
+    """Atomically replace the checkpoint file"""
+    tmp_path = path + '.tmp'
+    with open(tmp_path, 'w') as f:
+        json.dump(checkpoint, f, indent=2)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_path, path)
+
+
+def score_chunk(start_index, items, decoded, batch_size):
+    """Run one chunk of decoded items through the model and build output rows"""
+    crops = [batch for batch, _, _ in decoded if batch is not None]
+    if crops:
+        predictions, version = app.run_model(np.concatenate(crops), batch_size=batch_size)
+    else:
+        predictions, version = np.empty((0, len(EMOTIONS))), None
+
+    rows = []
+    cursor = 0
+    for offset, ((source, label), (batch, boxes, error)) in enumerate(zip(items, decoded)):
+        base = {
+            'item_index': start_index + offset, 'source': source, 'label': label,
+            'face_index': None, 'box_x': None, 'box_y': None, 'box_width': None, 'box_height': None,
+            'emotion': None, 'confidence': None, 'model_version': None, 'error': error,
+            **{c: None for c in PROB_COLUMNS}
+        }
+        if batch is None:
+            rows.append(base)
+            continue
+
+        for face_index, box in enumerate(boxes):
+            prediction = predictions[cursor]
+            cursor += 1
+            emotion_idx = int(np.argmax(prediction))
+            row = dict(base, face_index=face_index, emotion=EMOTIONS[emotion_idx],
+                       confidence=round(float(prediction[emotion_idx]) * 100, 4),
+                       model_version=version)
+            if box is not None:
+                row.update(box_x=box[0], box_y=box[1], box_width=box[2], box_height=box[3])
+            for column, probability in zip(PROB_COLUMNS, prediction):
+                row[column] = round(float(probability) * 100, 4)
+            rows.append(row)
+    return rows
+
+
+def run(args):
+    """Score all inputs chunk by chunk, checkpointing after each"""
+    if app.model is None:
+        sys.exit('❌ Model not loaded. Please ensure face_emotionModel.h5 exists.')
+
+    if args.csv:
+        job = {'csv': os.path.abspath(args.csv), 'output': os.path.abspath(args.output)}
+        items = iter_csv_rows(args.csv)
+        decode = decode_pixels
+    else:
+        job = {'input': os.path.abspath(args.input), 'output': os.path.abspath(args.output)}
+        items = ((path, None, path) for path in iter_image_paths(args.input))
+        decode = decode_path
+
+    checkpoint_path = args.checkpoint or f'{args.output}.checkpoint.json'
+    checkpoint = load_checkpoint(checkpoint_path, job) if args.resume else None
+    completed = checkpoint['completed'] if checkpoint else 0
+    writer = open_writer(args.output, checkpoint)
+
+    if completed:
+        print(f"⏩ Resuming after {completed} items")
+        items = islice(items, completed, None)
+
+    def chunks():
+        while True:
+            chunk = list(islice(items, args.chunk_size))
+            if not chunk:
+                return
+            yield chunk
+
+    start = time.time()
+    scored = 0
+    with ThreadPoolExecutor(max_workers=args.workers) as executor:
+        def submit(chunk):
+            return chunk, [executor.submit(decode, payload) for _, _, payload in chunk]
+
+        pending = None
+        for chunk in chunks():
+            # Decode this chunk in the background while the previous one is scored
+            submitted = submit(chunk)
+            if pending is not None:
+                completed, scored = _finish_chunk(pending, completed, scored, writer,
+                                                  checkpoint_path, job, args, start)
+            pending = submitted
+        if pending is not None:
+            completed, scored = _finish_chunk(pending, completed, scored, writer,
+                                              checkpoint_path, job, args, start)
+
+    writer.close()
+    print(f"\n✅ Scored {scored} items in {time.time() - start:.1f}s ({completed} total) → {args.output}")
+
+
+def _finish_chunk(pending, completed, scored, writer, checkpoint_path, job, args, start):
+    """Wait for a chunk's decodes, score it, write rows and advance the checkpoint"""
+    chunk, futures = pending
+    decoded = [future.result() for future in futures]
+    items = [(source, label) for source, label, _ in chunk]
+    rows = score_chunk(completed, items, decoded, args.batch_size)
+    writer.write(rows)
+
+    completed += len(chunk)
+    scored += len(chunk)
+    save_checkpoint(checkpoint_path, {'job': job, 'completed': completed, **writer.state()})
+
+    elapsed = time.time() - start
+    print(f"  {completed} items done ({scored / elapsed:.1f} items/s)", flush=True)
+    return completed, scored
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description='Bulk offline emotion scoring')
+    source = parser.add_mutually_exclusive_group(required=True)
+    source.add_argument('--input', help='Directory tree of images to score')
+    source.add_argument('--csv', help='emotions.csv-style file with a pixels column')
+    parser.add_argument('--output', required=True,
+                        help='Results file: .csv, .db/.sqlite or .parquet (a directory of parts)')
+    parser.add_argument('--workers', type=int, default=os.cpu_count() or 4,
+                        help='Decode threads (each loads its own face detector)')
+    parser.add_argument('--batch-size', type=int, default=BATCH_SIZE,
+                        help='Faces per model.predict call')
+    parser.add_argument('--chunk-size', type=int, default=CHUNK_SIZE,
+                        help='Items per checkpoint')
+    parser.add_argument('--checkpoint', help='Checkpoint path (default: <output>.checkpoint.json)')
+    parser.add_argument('--resume', action='store_true',
+                        help='Continue from the checkpoint instead of starting over')
+    return parser.parse_args(argv)
+
+
+if __name__ == "__main__":
+    run(parse_args())
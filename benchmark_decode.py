@@ -0,0 +1,132 @@
+# benchmark_decode.py
+"""
+Benchmark upload decoding: full-resolution decode vs bounded draft-mode decode
+Reports latency and peak memory per upload size. Each case runs in a child
+forked from a small fork server, so peak RSS measurements don't include the
+memory used to generate the test images or earlier cases.
+
+Usage:
+    python benchmark_decode.py [--repeats 5] [--max-dim 640]
+"""
+
+import argparse
+import io
+import multiprocessing
+import multiprocessing.forkserver
+import resource
+import statistics
+import time
+
+import numpy as np
+from PIL import Image
+
+from image_decode import decode_grayscale, ImageTooLargeError, MAX_IMAGE_PIXELS
+
+IMG_SIZE = 48
+
+# (width, height) of the synthetic JPEG uploads
+UPLOAD_SIZES = [
+    (640, 480),
+    (1920, 1080),
+    (4032, 3024),
+    (6000, 4000),
+    (8000, 6000),
+]
+
+
+def make_jpeg(width, height, quality=90):
+    """Create a photo-like JPEG (smooth gradients plus sensor noise) in memory"""
+    rng = np.random.default_rng(42)
+    y, x = np.mgrid[0:height, 0:width].astype('float32')
+    base = 128 + 60 * np.sin(x / 97.0) * np.cos(y / 71.0)
+    channels = [
+        np.clip(base + rng.normal(0, 4, (height, width)) + offset, 0, 255)
+        for offset in (-20, 0, 20)
+    ]
+    rgb = np.stack(channels, axis=-1).astype('uint8')
+
+    buf = io.BytesIO()
+    Image.fromarray(rgb, 'RGB').save(buf, 'JPEG', quality=quality)
+    return buf.getvalue()
+
+
+def full_decode(data, max_dim):
+    """Previous behaviour: decode at native resolution, then convert and resize"""
+    img = Image.open(io.BytesIO(data)).convert('L')
+    img = img.resize((IMG_SIZE, IMG_SIZE))
+    return np.array(img)
+
+
+def bounded_decode(data, max_dim):
+    """New behaviour: draft-mode grayscale decode capped at max_dim"""
+    gray, _ = decode_grayscale(io.BytesIO(data), max_dim)
+    return gray
+
+
+def _run_case(decoder, data, max_dim, repeats, conn):
+    """Child process body: time the decoder and report peak RSS growth"""
+    baseline_kb = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    timings = []
+    try:
+        for _ in range(repeats):
+            start = time.perf_counter()
+            decoder(data, max_dim)
+            timings.append(time.perf_counter() - start)
+    except ImageTooLargeError:
+        conn.send(None)
+    else:
+        peak_kb = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        conn.send((statistics.median(timings), peak_kb - baseline_kb))
+    conn.close()
+
+
+def measure(decoder, data, max_dim, repeats):
+    """Run one decoder on one upload in a fresh child process
+
+    Returns (median_seconds, peak_kb) or None if the upload was rejected.
+    """
+    ctx = multiprocessing.get_context('forkserver')
+    parent_conn, child_conn = ctx.Pipe()
+    proc = ctx.Process(target=_run_case, args=(decoder, data, max_dim, repeats, child_conn))
+    proc.start()
+    result = parent_conn.recv()
+    proc.join()
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--repeats', type=int, default=5)
+    parser.add_argument('--max-dim', type=int, default=640)
+    args = parser.parse_args()
+
+    print("=" * 78)
+    print(f"DECODE BENCHMARK (max_dim={args.max_dim}, median of {args.repeats} runs)")
+    print("=" * 78)
+    print(f"{'Resolution':>12} {'Upload':>9} | {'Full ms':>9} {'Full MB':>9} | "
+          f"{'Bounded ms':>10} {'Bounded MB':>10} | {'Speedup':>7}")
+    print("-" * 78)
+
+    # Start the fork server while this process is still small
+    multiprocessing.forkserver.ensure_running()
+
+    for width, height in UPLOAD_SIZES:
+        data = make_jpeg(width, height)
+        full_s, full_kb = measure(full_decode, data, args.max_dim, args.repeats)
+        bounded = measure(bounded_decode, data, args.max_dim, args.repeats)
+        row = (f"{width:>5}x{height:<6} {len(data) / 1e6:>7.2f}MB | "
+               f"{full_s * 1000:>9.1f} {full_kb / 1024:>9.1f} | ")
+        if bounded is None:
+            print(row + f"{'rejected (pixel limit)':>21} | {'-':>7}")
+            continue
+        bounded_s, bounded_kb = bounded
+        print(row + f"{bounded_s * 1000:>10.1f} {bounded_kb / 1024:>10.1f} | "
+              f"{full_s / bounded_s:>6.1f}x")
+
+    print("-" * 78)
+    print("MB columns are peak RSS growth of the decoding process.")
+    print(f"Pixel limit (MAX_IMAGE_PIXELS): {MAX_IMAGE_PIXELS:,}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,214 @@
+# cascade.py
+"""
+Two-stage cascade inference
+A small fast model answers every face whose top softmax probability clears a
+calibrated threshold; the rest of the batch is escalated to the full model.
+The threshold is calibrated on one half of the validation data so the cascade
+stays within a set accuracy drop of the full model; the report uses the other
+half, so its accuracy is measured on samples the threshold was not fitted to.
+
+A fast model and its threshold only hold for the full model they were
+calibrated against, so both are stored in that model's registry version
+(models/<version>/fast_model.h5 and cascade_config.json; the project root for
+the legacy model).
+
+Usage (after training both models):
+    python cascade.py            # Latency / accuracy report on the validation set
+"""
+
+import json
+import os
+import time
+
+import numpy as np
+
+import model_registry
+
+FAST_MODEL_FILENAME = 'fast_model.h5'
+CASCADE_CONFIG_FILENAME = 'cascade_config.json'
+# Where the legacy face_emotionModel.h5 keeps its cascade
+FAST_MODEL_PATH = 'face_emotionModel_fast.h5'
+CASCADE_CONFIG_PATH = 'cascade_config.json'
+MAX_ACCURACY_DROP = 0.005   # Allowed cascade accuracy loss vs the full model
+CALIBRATION_FRACTION = 0.5  # Share of the validation set used to pick the threshold
+
+
+def fast_model_path(version):
+    """Path of the fast model calibrated against a full model version"""
+    if version == model_registry.LEGACY_VERSION:
+        return FAST_MODEL_PATH
+    return os.path.join(model_registry.REGISTRY_DIR, version, FAST_MODEL_FILENAME)
+
+
+def config_path(version):
+    """Path of the calibration for a full model version"""
+    if version == model_registry.LEGACY_VERSION:
+        return CASCADE_CONFIG_PATH
+    return os.path.join(model_registry.REGISTRY_DIR, version, CASCADE_CONFIG_FILENAME)
+
+
+def config_stamp(version):
+    """Modification time of a version's calibration, or None if it has none"""
+    try:
+        return os.path.getmtime(config_path(version))
+    except OSError:
+        return None
+
+
+def split_validation(n_samples, fraction=CALIBRATION_FRACTION, seed=42):
+    """Fixed split of validation indices into (calibration, report) sets"""
+    order = np.random.default_rng(seed).permutation(n_samples)
+    n_calibration = int(n_samples * fraction)
+    return np.sort(order[:n_calibration]), np.sort(order[n_calibration:])
+
+
+def calibrate_threshold(fast_probs, full_probs, y_true, max_accuracy_drop=MAX_ACCURACY_DROP):
+    """Pick the lowest confidence threshold whose cascade accuracy is close enough to the full model
+
+    A lower threshold lets the fast model answer more traffic. Returns a dict
+    with the threshold and the validation accuracy / coverage it gives.
+    """
+    fast_conf = fast_probs.max(axis=1)
+    fast_correct = fast_probs.argmax(axis=1) == y_true
+    full_correct = full_probs.argmax(axis=1) == y_true
+    full_accuracy = float(full_correct.mean())
+
+    # Accept samples in order of decreasing fast-model confidence; after the
+    # first k are accepted, cascade accuracy is fast hits on those k plus full
+    # hits on the rest
+    order = np.argsort(-fast_conf)
+    fast_hits = np.concatenate([[0], np.cumsum(fast_correct[order])])
+    full_hits_rest = np.concatenate([np.cumsum(full_correct[order][::-1])[::-1], [0]])
+    cascade_accuracy = (fast_hits + full_hits_rest) / len(y_true)
+
+    # k accepted samples corresponds to threshold = confidence of the k-th one
+    acceptable = np.nonzero(cascade_accuracy >= full_accuracy - max_accuracy_drop)[0]
+    k = int(acceptable.max())
+    threshold = float(fast_conf[order][k - 1]) if k > 0 else 1.01
+
+    return {
+        'threshold': threshold,
+        'fast_fraction': k / len(y_true),
+        'cascade_accuracy': float(cascade_accuracy[k]),
+        'full_accuracy': full_accuracy,
+        'fast_accuracy': float(fast_correct.mean()),
+        'max_accuracy_drop': max_accuracy_drop,
+        'calibration_samples': int(len(y_true))
+    }
+
+
+def save_cascade(fast_model, calibration, version):
+    """Store a fast model and its calibration with the full model version they belong to
+
+    The config is replaced last, so a watcher that sees it change finds the
+    matching fast model already in place.
+    """
+    model_path = fast_model_path(version)
+    fast_model.save(f'{model_path}.tmp.h5')
+    os.replace(f'{model_path}.tmp.h5', model_path)
+
+    path = config_path(version)
+    with open(f'{path}.tmp', 'w') as f:
+        json.dump({'full_model_version': version, **calibration}, f, indent=2)
+    os.replace(f'{path}.tmp', path)
+
+
+def load_config(version):
+    with open(config_path(version)) as f:
+        return json.load(f)
+
+
+def cascade_predict(fast_model, full_model, batch, threshold, **kwargs):
+    """Predict a batch with the fast model, escalating low-confidence rows to the full model
+
+    Returns (probabilities, escalated) where escalated is a boolean mask of
+    the rows answered by the full model.
+    """
+    probabilities = fast_model.predict(batch, verbose=0, **kwargs)
+    escalated = probabilities.max(axis=1) < threshold
+    if escalated.any():
+        probabilities = probabilities.copy()
+        probabilities[escalated] = full_model.predict(batch[escalated], verbose=0, **kwargs)
+    return probabilities, escalated
+
+
+def _latency_stats(latencies):
+    latencies = np.asarray(latencies) * 1000
+    return {
+        'mean_ms': float(latencies.mean()),
+        'p50_ms': float(np.percentile(latencies, 50)),
+        'p99_ms': float(np.percentile(latencies, 99))
+    }
+
+
+def report(fast_model, full_model, X_val, y_val, threshold, max_samples=1000):
+    """Time single-image requests through the full model and through the cascade"""
+    n = min(len(X_val), max_samples)
+    X, y = X_val[:n], np.asarray(y_val[:n])
+
+    # Warm up both models so compilation is not counted
+    full_model.predict(X[:1], verbose=0)
+    fast_model.predict(X[:1], verbose=0)
+
+    full_latencies, cascade_latencies = [], []
+    full_correct = cascade_correct = escalated_count = 0
+    for i in range(n):
+        sample = X[i:i + 1]
+
+        start = time.perf_counter()
+        full_probs = full_model.predict(sample, verbose=0)
+        full_latencies.append(time.perf_counter() - start)
+
+        start = time.perf_counter()
+        cascade_probs, escalated = cascade_predict(fast_model, full_model, sample, threshold)
+        cascade_latencies.append(time.perf_counter() - start)
+
+        full_correct += int(full_probs[0].argmax() == y[i])
+        cascade_correct += int(cascade_probs[0].argmax() == y[i])
+        escalated_count += int(escalated[0])
+
+    return {
+        'samples': n,
+        'threshold': threshold,
+        'fast_stage_fraction': 1 - escalated_count / n,
+        'full_stage_fraction': escalated_count / n,
+        'full_model': {'accuracy': full_correct / n, **_latency_stats(full_latencies)},
+        'cascade': {'accuracy': cascade_correct / n, **_latency_stats(cascade_latencies)},
+        'fast_model_params': int(fast_model.count_params()),
+        'full_model_params': int(full_model.count_params())
+    }
+
+
+if __name__ == "__main__":
+    os.environ['KERAS_BACKEND'] = 'jax'
+    from keras.models import load_model
+    from model_training_simple import load_data
+    from training_state import load_production_model
+
+    _, _, X_val, y_val = load_data()
+    # Only the half of the validation set the threshold was not calibrated on
+    _, report_idx = split_validation(len(X_val))
+    X_val, labels = X_val[report_idx], y_val[report_idx].argmax(axis=1)
+
+    full_model, version = load_production_model()
+    fast_model = load_model(fast_model_path(version))
+    config = load_config(version)
+    print(f"Cascade for model {version}")
+
+    results = report(fast_model, full_model, X_val, labels, config['threshold'])
+
+    print("\n" + "=" * 70)
+    print("CASCADE REPORT (single-image requests, held-out validation half)")
+    print("=" * 70)
+    print(f"Threshold:            {results['threshold']:.3f}")
+    print(f"Handled by fast model: {results['fast_stage_fraction'] * 100:.1f}%")
+    print(f"Escalated to full:     {results['full_stage_fraction'] * 100:.1f}%")
+    print(f"{'':12} {'Accuracy':>10} {'Mean ms':>10} {'p50 ms':>10} {'p99 ms':>10}")
+    for name in ('full_model', 'cascade'):
+        r = results[name]
+        print(f"{name:12} {r['accuracy'] * 100:>9.2f}% {r['mean_ms']:>10.2f} "
+              f"{r['p50_ms']:>10.2f} {r['p99_ms']:>10.2f}")
+
+    with open('cascade_report.json', 'w') as f:
+        json.dump(results, f, indent=2)
+    print("\n✅ Report saved to cascade_report.json")
@@ -0,0 +1,234 @@
+# distill_model.py
+"""
+Knowledge distillation for compact emotion models
+Trains small student CNNs (depthwise-separable convolutions and global average
+pooling instead of Flatten + Dense(512)) against the soft targets of the
+trained face_emotionModel.h5 teacher, then reports size, CPU latency and
+accuracy for each student next to the teacher.
+
+Usage:
+    python distill_model.py
+    python distill_model.py --students ds_tiny,ds_small --temperature 4 --alpha 0.1
+"""
+
+# Set Keras backend to JAX (compatible with Python 3.14)
+import os
+os.environ['KERAS_BACKEND'] = 'jax'
+
+import argparse
+import json
+import tempfile
+import time
+
+import numpy as np
+from keras.models import Model, load_model
+from keras.layers import (
+    Input, Conv2D, SeparableConv2D, MaxPooling2D, GlobalAveragePooling2D,
+    Dense, Dropout, BatchNormalization, Activation, Rescaling
+)
+from keras.callbacks import EarlyStopping, ReduceLROnPlateau
+
+from model_training_simple import load_data, IMG_SIZE, BATCH_SIZE, EPOCHS, EMOTIONS
+import cascade
+import model_registry
+
+TEACHER_PATH = 'face_emotionModel.h5'
+REPORT_PATH = 'distillation_report.json'
+
+# Student architectures: filters per block; every block after the first uses
+# depthwise-separable convolutions
+STUDENTS = {
+    'ds_tiny': {'filters': (16, 32, 64), 'dropout': 0.2},
+    'ds_small': {'filters': (32, 64, 128), 'dropout': 0.25},
+    'ds_medium': {'filters': (48, 96, 192, 256), 'dropout': 0.3},
+}
+
+
+def build_student(filters, dropout=0.25, temperature=4.0):
+    """Build a student returning (probabilities, softened probabilities)
+
+    Both heads share the same logits; the softened head divides them by the
+    distillation temperature.
+    """
+    inputs = Input(shape=(IMG_SIZE, IMG_SIZE, 1))
+    x = inputs
+    for i, n in enumerate(filters):
+        # A separable conv on a single input channel saves nothing, so the
+        # first block uses a regular convolution
+        conv = Conv2D if i == 0 else SeparableConv2D
+        x = conv(n, (3, 3), padding='same', use_bias=False)(x)
+        x = BatchNormalization()(x)
+        x = Activation('relu')(x)
+        x = SeparableConv2D(n, (3, 3), padding='same', use_bias=False)(x)
+        x = BatchNormalization()(x)
+        x = Activation('relu')(x)
+        x = MaxPooling2D(pool_size=(2, 2))(x)
+
+    x = GlobalAveragePooling2D()(x)
+    x = Dropout(dropout)(x)
+    logits = Dense(len(EMOTIONS), name='logits')(x)
+
+    probabilities = Activation('softmax', name='hard')(logits)
+    softened = Activation('softmax', name='soft')(Rescaling(1.0 / temperature)(logits))
+    return Model(inputs, [probabilities, softened])
+
+
+def soften(probabilities, temperature):
+    """Teacher soft targets: softmax(log(p) / T), i.e. the teacher's logits at temperature T"""
+    logits = np.log(np.clip(probabilities, 1e-7, 1.0)) / temperature
+    logits -= logits.max(axis=1, keepdims=True)
+    exp = np.exp(logits)
+    return exp / exp.sum(axis=1, keepdims=True)
+
+
+def distill_student(name, config, X_train, y_train, X_val, y_val,
+                    teacher_train, teacher_val, temperature, alpha, epochs):
+    """Train one student; returns the inference model (probabilities head only)"""
+    print("\n" + "="*70)
+    print(f"DISTILLING STUDENT {name}")
+    print("="*70)
+
+    student = build_student(config['filters'], config['dropout'], temperature)
+    # Hinton et al.: scale the soft loss by T^2 so its gradients stay comparable
+    student.compile(
+        optimizer='adam',
+        loss={'hard': 'categorical_crossentropy', 'soft': 'kl_divergence'},
+        loss_weights={'hard': alpha, 'soft': (1 - alpha) * temperature ** 2},
+        metrics={'hard': ['accuracy']}
+    )
+
+    student.fit(
+        X_train, {'hard': y_train, 'soft': soften(teacher_train, temperature)},
+        validation_data=(X_val, {'hard': y_val, 'soft': soften(teacher_val, temperature)}),
+        batch_size=BATCH_SIZE,
+        epochs=epochs,
+        callbacks=[
+            EarlyStopping(monitor='val_hard_accuracy', mode='max', patience=10,
+                          restore_best_weights=True, verbose=1),
+            ReduceLROnPlateau(monitor='val_loss', factor=0.5, patience=5, min_lr=1e-7, verbose=1)
+        ],
+        verbose=1
+    )
+
+    inference = Model(student.input, student.get_layer('hard').output, name=f'student_{name}')
+    inference.compile(optimizer='adam', loss='categorical_crossentropy', metrics=['accuracy'])
+    return inference
+
+
+def measure(model, path, X_val, y_val, repeats=200):
+    """Size, single-image CPU latency and validation accuracy of a saved model"""
+    sample = X_val[:1]
+    model.predict_on_batch(sample)  # Compile before timing
+
+    latencies = []
+    for i in range(repeats):
+        start = time.perf_counter()
+        model.predict_on_batch(X_val[i % len(X_val):i % len(X_val) + 1])
+        latencies.append(time.perf_counter() - start)
+    latencies = np.array(latencies) * 1000
+
+    predictions = model.predict(X_val, verbose=0)
+    accuracy = float((predictions.argmax(axis=1) == y_val.argmax(axis=1)).mean())
+
+    return {
+        'params': int(model.count_params()),
+        'file_size_mb': os.path.getsize(path) / 1024 / 1024,
+        'latency_mean_ms': float(latencies.mean()),
+        'latency_p99_ms': float(np.percentile(latencies, 99)),
+        'val_accuracy': accuracy
+    }
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description='Distill compact student models from the trained teacher')
+    parser.add_argument('--students', default=','.join(STUDENTS),
+                        help=f'Comma-separated student names ({", ".join(STUDENTS)})')
+    parser.add_argument('--temperature', type=float, default=4.0)
+    parser.add_argument('--alpha', type=float, default=0.1,
+                        help='Weight of the hard-label loss (the rest goes to the soft targets)')
+    parser.add_argument('--epochs', type=int, default=EPOCHS)
+    parser.add_argument('--register', action='store_true',
+                        help='Add each student to the model registry (not activated)')
+    return parser.parse_args()
+
+
+def main():
+    args = parse_args()
+    names = [n.strip() for n in args.students.split(',') if n.strip()]
+    unknown = [n for n in names if n not in STUDENTS]
+    if unknown:
+        raise SystemExit(f"❌ Unknown students: {', '.join(unknown)}")
+
+    if not os.path.exists(TEACHER_PATH):
+        raise SystemExit(f"❌ Teacher model {TEACHER_PATH} not found. Train it first.")
+
+    X_train, y_train, X_val, y_val = load_data()
+
+    print(f"\n🎓 Loading teacher from {TEACHER_PATH}...")
+    teacher = load_model(TEACHER_PATH)
+    teacher_train = teacher.predict(X_train, verbose=0)
+    teacher_val = teacher.predict(X_val, verbose=0)
+
+    # Students early-stop on one half of the validation set and every model
+    # is reported on the other, so the accuracies are not in-sample
+    select_idx, report_idx = cascade.split_validation(len(X_val))
+    X_select, y_select, teacher_select = X_val[select_idx], y_val[select_idx], teacher_val[select_idx]
+    X_report, y_report = X_val[report_idx], y_val[report_idx]
+
+    # Training saved the teacher with its optimizer state; measure it as
+    # served, the same way the students are saved
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        serving_path = os.path.join(tmp_dir, 'teacher.h5')
+        teacher.save(serving_path, include_optimizer=False)
+        teacher_stats = measure(teacher, serving_path, X_report, y_report)
+
+    report = {
+        'temperature': args.temperature,
+        'alpha': args.alpha,
+        'report_samples': int(len(report_idx)),
+        'models': {'teacher': teacher_stats}
+    }
+
+    for name in names:
+        student = distill_student(
+            name, STUDENTS[name], X_train, y_train, X_select, y_select,
+            teacher_train, teacher_select, args.temperature, args.alpha, args.epochs
+        )
+        path = f'face_emotionModel_{name}.h5'
+        # Serving only needs the weights, not the optimizer state
+        student.save(path, include_optimizer=False)
+        print(f"✅ Student saved as {path}")
+
+        report['models'][name] = measure(student, path, X_report, y_report)
+
+        if args.register:
+            model_registry.register_model(student, {
+                'script': 'distill_model.py',
+                'student': name,
+                'teacher': TEACHER_PATH,
+                'temperature': args.temperature,
+                'alpha': args.alpha,
+                'val_accuracy': report['models'][name]['val_accuracy'],
+                'img_size': IMG_SIZE,
+                'emotions': EMOTIONS
+            }, activate=False)
+
+    print("\n" + "="*70)
+    print("DISTILLATION REPORT (held-out validation half)")
+    print("="*70)
+    teacher_stats = report['models']['teacher']
+    print(f"{'Model':<10} {'Params':>10} {'Size MB':>8} {'Mean ms':>8} {'p99 ms':>8} "
+          f"{'Accuracy':>9} {'Speedup':>8}")
+    for name, stats in report['models'].items():
+        print(f"{name:<10} {stats['params']:>10,} {stats['file_size_mb']:>8.2f} "
+              f"{stats['latency_mean_ms']:>8.2f} {stats['latency_p99_ms']:>8.2f} "
+              f"{stats['val_accuracy'] * 100:>8.2f}% "
+              f"{teacher_stats['latency_mean_ms'] / stats['latency_mean_ms']:>7.1f}x")
+
+    with open(REPORT_PATH, 'w') as f:
+        json.dump(report, f, indent=2)
+    print(f"\n✅ Report saved to {REPORT_PATH}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,286 @@
+# history_store.py
+"""
+Time-partitioned prediction history
+Raw predictions go to one SQLite file per month (history/emotions-2026-10.db),
+so inserts and recent-history queries only touch a small file and old months
+can be backed up or dropped as whole files. Rows older than the retention
+window are rolled up into daily per-emotion counts in the main database
+(emotion_daily in database.db) and then deleted. Partition files use
+incremental auto-vacuum, so deleted rows give disk space back without a full
+VACUUM.
+"""
+
+import os
+import re
+import sqlite3
+import threading
+import time
+from datetime import datetime, timedelta, timezone
+from pathlib import Path
+
+PARTITION_PATTERN = re.compile(r'^emotions-(\d{4})-(\d{2})\.db$')
+TIMESTAMP_FORMAT = '%Y-%m-%d %H:%M:%S'   # Same as SQLite's CURRENT_TIMESTAMP (UTC)
+
+PARTITION_SCHEMA = '''
+    CREATE TABLE IF NOT EXISTS emotions (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        emotion TEXT NOT NULL,
+        confidence REAL,
+        filename TEXT,
+        timestamp DATETIME DEFAULT CURRENT_TIMESTAMP,
+        model_version TEXT
+    )
+'''
+
+ROLLUP_SCHEMA = '''
+    CREATE TABLE IF NOT EXISTS emotion_daily (
+        day TEXT NOT NULL,
+        emotion TEXT NOT NULL,
+        count INTEGER NOT NULL,
+        confidence_sum REAL NOT NULL,
+        PRIMARY KEY (day, emotion)
+    )
+'''
+
+
+def _utcnow():
+    return datetime.now(timezone.utc).replace(tzinfo=None)
+
+
+def _partition_uri(path, mode):
+    """SQLite URI for an existing partition; opening it never creates the file
+
+    Another worker's compact() may delete a partition between listing and
+    opening it, and a plain connect would leave an empty file in its place.
+    """
+    return f'{Path(path).resolve().as_uri()}?mode={mode}'
+
+
+def _read_partition(path, query, params=()):
+    """Rows of a read-only query on a partition, or None if it has been removed"""
+    try:
+        conn = sqlite3.connect(_partition_uri(path, 'ro'), uri=True)
+    except sqlite3.OperationalError:
+        return None
+    try:
+        return conn.execute(query, params).fetchall()
+    except sqlite3.OperationalError:
+        return None     # Missing, or an empty file without the table
+    finally:
+        conn.close()
+
+
+class HistoryStore:
+    """Monthly-partitioned history with a rollup table for expired rows"""
+
+    def __init__(self, database_path, partition_dir, raw_retention_days=90, maintenance_interval=3600):
+        self.database_path = database_path
+        self.partition_dir = partition_dir
+        self.raw_retention_days = raw_retention_days
+        self.maintenance_interval = maintenance_interval
+        self._maintenance_thread = None
+        self._lock = threading.Lock()
+
+    def _partition_path(self, month):
+        return os.path.join(self.partition_dir, f'emotions-{month}.db')
+
+    def _partitions(self):
+        """(month, path) for every partition file, newest first"""
+        if not os.path.isdir(self.partition_dir):
+            return []
+        partitions = []
+        for name in os.listdir(self.partition_dir):
+            match = PARTITION_PATTERN.match(name)
+            if match:
+                partitions.append((f'{match.group(1)}-{match.group(2)}', os.path.join(self.partition_dir, name)))
+        return sorted(partitions, reverse=True)
+
+    def _connect_partition(self, month):
+        os.makedirs(self.partition_dir, exist_ok=True)
+        conn = sqlite3.connect(self._partition_path(month))
+        # Only takes effect on a new, empty file; must precede the first table
+        conn.execute("PRAGMA auto_vacuum = INCREMENTAL")
+        conn.execute(PARTITION_SCHEMA)
+        conn.execute("CREATE INDEX IF NOT EXISTS idx_emotions_timestamp ON emotions (timestamp)")
+        return conn
+
+    def init(self):
+        """Create the rollup table and move rows from the old single emotions table into partitions"""
+        conn = sqlite3.connect(self.database_path)
+        try:
+            conn.execute(ROLLUP_SCHEMA)
+            conn.commit()
+
+            has_legacy = conn.execute(
+                "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'emotions'"
+            ).fetchone()
+            if has_legacy:
+                self._migrate_legacy(conn)
+        finally:
+            conn.close()
+
+    def _migrate_legacy(self, conn):
+        """Move every row of the pre-partitioning emotions table into its month's partition
+
+        Each month moves in one transaction across both files. Several workers
+        starting at once may race here; whichever loses finds nothing left.
+        """
+        month_expr = "strftime('%Y-%m', COALESCE(timestamp, CURRENT_TIMESTAMP))"
+        try:
+            columns = {row[1] for row in conn.execute("PRAGMA table_info(emotions)")}
+            version_column = 'model_version' if 'model_version' in columns else 'NULL'
+            months = [row[0] for row in conn.execute(f"SELECT DISTINCT {month_expr} FROM emotions")]
+            for month in months:
+                self._connect_partition(month).close()
+                conn.execute("ATTACH DATABASE ? AS part", (self._partition_path(month),))
+                try:
+                    with conn:
+                        conn.execute(
+                            "INSERT INTO part.emotions (emotion, confidence, filename, timestamp, model_version) "
+                            f"SELECT emotion, confidence, filename, COALESCE(timestamp, CURRENT_TIMESTAMP), "
+                            f"{version_column} FROM main.emotions WHERE {month_expr} = ?",
+                            (month,)
+                        )
+                        conn.execute(f"DELETE FROM main.emotions WHERE {month_expr} = ?", (month,))
+                finally:
+                    conn.execute("DETACH DATABASE part")
+            conn.execute("DROP TABLE IF EXISTS emotions")
+            conn.commit()
+        except sqlite3.OperationalError as e:
+            if 'no such table' not in str(e):
+                raise
+            return  # Another worker finished the migration first
+        if months:
+            print(f"✅ Moved history into {len(months)} monthly partitions")
+
+    def add(self, emotion, confidence, filename, model_version=None):
+        """Insert a prediction into the current month's partition"""
+        self.start_maintenance()
+        now = _utcnow()
+        conn = self._connect_partition(now.strftime('%Y-%m'))
+        try:
+            conn.execute(
+                "INSERT INTO emotions (emotion, confidence, filename, timestamp, model_version) VALUES (?, ?, ?, ?, ?)",
+                (emotion, confidence, filename, now.strftime(TIMESTAMP_FORMAT), model_version)
+            )
+            conn.commit()
+        finally:
+            conn.close()
+
+    def recent(self, limit=50):
+        """Newest raw rows across partitions, reading only as many months as needed"""
+        rows = []
+        for _, path in self._partitions():
+            rows.extend(_read_partition(
+                path,
+                "SELECT emotion, confidence, filename, timestamp, model_version FROM emotions "
+                "ORDER BY timestamp DESC LIMIT ?",
+                (limit - len(rows),)
+            ) or [])
+            if len(rows) >= limit:
+                break
+        return rows
+
+    def emotion_counts(self):
+        """Count per emotion over raw partitions and rolled-up days, largest first"""
+        counts = {}
+        conn = sqlite3.connect(self.database_path)
+        try:
+            for emotion, count in conn.execute("SELECT emotion, SUM(count) FROM emotion_daily GROUP BY emotion"):
+                counts[emotion] = counts.get(emotion, 0) + count
+        finally:
+            conn.close()
+
+        for _, path in self._partitions():
+            partition_counts = _read_partition(path, "SELECT emotion, COUNT(*) FROM emotions GROUP BY emotion")
+            for emotion, count in partition_counts or []:
+                counts[emotion] = counts.get(emotion, 0) + count
+
+        return dict(sorted(counts.items(), key=lambda item: item[1], reverse=True))
+
+    def compact(self, now=None):
+        """Roll rows past the retention window into emotion_daily and delete them
+
+        Rollup and delete run in one transaction across both files, so a row is
+        never counted twice or lost. Partitions left empty for a month wholly
+        past the cutoff are deleted; others are incrementally vacuumed.
+        Returns (rows_rolled_up, partitions_removed).
+        """
+        if not self.raw_retention_days:
+            return 0, 0
+
+        with self._lock:
+            cutoff = (now or _utcnow()) - timedelta(days=self.raw_retention_days)
+            cutoff_text = cutoff.strftime(TIMESTAMP_FORMAT)
+            rolled = removed = 0
+
+            conn = sqlite3.connect(self.database_path, uri=True)
+            try:
+                conn.execute(ROLLUP_SCHEMA)
+                for month, path in self._partitions():
+                    if month > cutoff.strftime('%Y-%m'):
+                        continue    # Entirely inside the retention window
+
+                    try:
+                        conn.execute("ATTACH DATABASE ? AS part", (_partition_uri(path, 'rw'),))
+                    except sqlite3.OperationalError:
+                        continue    # Removed by another worker since it was listed
+                    try:
+                        has_table = conn.execute(
+                            "SELECT 1 FROM part.sqlite_master WHERE type = 'table' AND name = 'emotions'"
+                        ).fetchone()
+                        # A file without the table was left empty by an older reader
+                        # that recreated a removed partition; it is dropped below
+                        remaining = 0
+                        if has_table:
+                            with conn:
+                                conn.execute(
+                                    "INSERT INTO main.emotion_daily (day, emotion, count, confidence_sum) "
+                                    "SELECT date(timestamp), emotion, COUNT(*), COALESCE(SUM(confidence), 0) "
+                                    "FROM part.emotions WHERE timestamp < ? GROUP BY date(timestamp), emotion "
+                                    "ON CONFLICT (day, emotion) DO UPDATE SET "
+                                    "count = count + excluded.count, "
+                                    "confidence_sum = confidence_sum + excluded.confidence_sum",
+                                    (cutoff_text,)
+                                )
+                                rolled += conn.execute(
+                                    "DELETE FROM part.emotions WHERE timestamp < ?", (cutoff_text,)
+                                ).rowcount
+                            remaining = conn.execute("SELECT COUNT(*) FROM part.emotions").fetchone()[0]
+                            if remaining:
+                                # Each result row frees one page; fetch them all to finish
+                                conn.execute("PRAGMA part.incremental_vacuum").fetchall()
+                    finally:
+                        conn.execute("DETACH DATABASE part")
+
+                    if not remaining and month < cutoff.strftime('%Y-%m'):
+                        try:
+                            os.remove(path)
+                            removed += 1
+                        except FileNotFoundError:
+                            pass    # Another worker removed it first
+            finally:
+                conn.close()
+
+            return rolled, removed
+
+    def _maintenance_loop(self):
+        while True:
+            try:
+                rolled, removed = self.compact()
+                if rolled or removed:
+                    print(f"🗜️  Rolled up {rolled} history rows, removed {removed} partitions")
+            except Exception as e:
+                print(f"History maintenance error: {e}")
+            time.sleep(self.maintenance_interval)
+
+    def start_maintenance(self):
+        """Start the background rollup / retention thread once per process"""
+        if self._maintenance_thread is not None or not self.maintenance_interval or not self.raw_retention_days:
+            return
+        with self._lock:
+            if self._maintenance_thread is None:
+                self._maintenance_thread = threading.Thread(
+                    target=self._maintenance_loop, name='history-maintenance', daemon=True
+                )
+                self._maintenance_thread.start()
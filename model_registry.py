@@ -0,0 +1,150 @@
+# model_registry.py
+"""
+Versioned model registry
+Each trained model is stored as models/<version>/model.h5 next to a
+metadata.json written by the training script. models/ACTIVE names the version
+the web app should serve; changing it (here or through the admin endpoint)
+makes running workers load and swap in that version. models/LAST_GOOD names
+the last version a worker loaded successfully, which startup falls back to
+when the active version cannot be loaded.
+"""
+
+import json
+import os
+import shutil
+from datetime import datetime
+
+REGISTRY_DIR = os.environ.get('MODEL_REGISTRY_DIR', 'models')
+MODEL_FILENAME = 'model.h5'
+METADATA_FILENAME = 'metadata.json'
+ACTIVE_FILENAME = 'ACTIVE'
+LAST_GOOD_FILENAME = 'LAST_GOOD'
+
+# Version name used for the unversioned face_emotionModel.h5 in the project root
+LEGACY_VERSION = 'legacy'
+LEGACY_MODEL_PATH = 'face_emotionModel.h5'
+
+
+def model_path(version, registry_dir=REGISTRY_DIR):
+    """Path of the model file for a version"""
+    if version == LEGACY_VERSION:
+        return LEGACY_MODEL_PATH
+    return os.path.join(registry_dir, version, MODEL_FILENAME)
+
+
+def new_version_name(registry_dir=REGISTRY_DIR):
+    """Timestamp-based version name that does not exist yet"""
+    base = datetime.now().strftime('v%Y%m%d-%H%M%S')
+    version, suffix = base, 1
+    while os.path.exists(os.path.join(registry_dir, version)):
+        suffix += 1
+        version = f'{base}-{suffix}'
+    return version
+
+
+def register_model(model, metadata, registry_dir=REGISTRY_DIR, activate=True, extra_files=None):
+    """Save a trained Keras model and its metadata as a new registry version
+
+    extra_files maps file names to JSON data stored alongside the model. The
+    version directory is written under a temporary name and renamed into
+    place, so a watcher never sees a half-written model. Returns the version.
+    """
+    os.makedirs(registry_dir, exist_ok=True)
+    version = new_version_name(registry_dir)
+    tmp_dir = os.path.join(registry_dir, f'.tmp-{version}')
+    os.makedirs(tmp_dir)
+
+    try:
+        model.save(os.path.join(tmp_dir, MODEL_FILENAME))
+        metadata = {
+            'version': version,
+            'created_at': datetime.now().isoformat(),
+            'total_params': int(model.count_params()),
+            **metadata
+        }
+        with open(os.path.join(tmp_dir, METADATA_FILENAME), 'w') as f:
+            json.dump(metadata, f, indent=2)
+        for filename, data in (extra_files or {}).items():
+            with open(os.path.join(tmp_dir, filename), 'w') as f:
+                json.dump(data, f)
+        os.replace(tmp_dir, os.path.join(registry_dir, version))
+    except Exception:
+        shutil.rmtree(tmp_dir, ignore_errors=True)
+        raise
+
+    print(f"📦 Registered model version {version} in {registry_dir}/")
+    if activate:
+        set_active_version(version, registry_dir)
+    return version
+
+
+def get_metadata(version, registry_dir=REGISTRY_DIR):
+    """Metadata recorded for a version (just its path for the legacy model)"""
+    if version == LEGACY_VERSION:
+        return {'version': LEGACY_VERSION, 'path': LEGACY_MODEL_PATH}
+    with open(os.path.join(registry_dir, version, METADATA_FILENAME)) as f:
+        return json.load(f)
+
+
+def list_versions(registry_dir=REGISTRY_DIR):
+    """All registered versions, oldest first"""
+    if not os.path.isdir(registry_dir):
+        return []
+    return sorted(
+        name for name in os.listdir(registry_dir)
+        if not name.startswith('.') and os.path.isfile(model_path(name, registry_dir))
+    )
+
+
+def check_version(version, registry_dir=REGISTRY_DIR):
+    """Raise ValueError unless the version is the legacy model or a registered version
+
+    Only names from list_versions() are accepted, so half-written .tmp-*
+    directories and paths outside the registry are rejected.
+    """
+    if version == LEGACY_VERSION:
+        return
+    if not isinstance(version, str) or version not in list_versions(registry_dir):
+        raise ValueError(f'Unknown model version: {version}')
+
+
+def _read_pointer(filename, registry_dir):
+    try:
+        with open(os.path.join(registry_dir, filename)) as f:
+            return f.read().strip() or None
+    except FileNotFoundError:
+        return None
+
+
+def _write_pointer(filename, version, registry_dir):
+    os.makedirs(registry_dir, exist_ok=True)
+    path = os.path.join(registry_dir, filename)
+    tmp_path = f'{path}.{os.getpid()}.tmp'
+    with open(tmp_path, 'w') as f:
+        f.write(version + '\n')
+    os.replace(tmp_path, path)
+
+
+def get_active_version(registry_dir=REGISTRY_DIR):
+    """Version named in the ACTIVE file, or None if nothing has been activated"""
+    return _read_pointer(ACTIVE_FILENAME, registry_dir)
+
+
+def set_active_version(version, registry_dir=REGISTRY_DIR):
+    """Atomically point ACTIVE at a version"""
+    check_version(version, registry_dir)
+    _write_pointer(ACTIVE_FILENAME, version, registry_dir)
+
+
+def get_last_good_version(registry_dir=REGISTRY_DIR):
+    """Last version a worker loaded successfully, or None"""
+    return _read_pointer(LAST_GOOD_FILENAME, registry_dir)
+
+
+def set_last_good_version(version, registry_dir=REGISTRY_DIR):
+    """Record a version that loaded successfully
+
+    The legacy model is always the last fallback, so it is not recorded.
+    """
+    if version != LEGACY_VERSION:
+        _write_pointer(LAST_GOOD_FILENAME, version, registry_dir)
@@ -14,9 +14,12 @@ import keras
 from keras.models import Sequential
 from keras.layers import Conv2D, MaxPooling2D, Flatten, Dense, Dropout, BatchNormalization
 from keras.callbacks import EarlyStopping, ReduceLROnPlateau
+from keras.optimizers import Adam
 from keras.utils import to_categorical, image_dataset_from_directory
-from sklearn.model_selection import train_test_split
 from PIL import Image
+import argparse
+import model_registry
+import training_state
 
 print("🚀 Starting Emotion Detection Model Training...")
 print(f"Keras Version: {keras.__version__}")
@@ -56,10 +59,10 @@ def load_data_from_csv(csv_path='data/data/emotions.csv'):
     # Convert labels to categorical
     y = to_categorical(emotions, num_classes=7)
 
-    # Split data
-    X_train, X_val, y_train, y_val = train_test_split(
-        X, y, test_size=0.2, random_state=42, stratify=emotions
-    )
+    # Split by content hash so the split stays put when rows are appended
+    val_mask = training_state.validation_mask(training_state.sample_keys(X))
+    X_train, X_val = X[~val_mask], X[val_mask]
+    y_train, y_val = y[~val_mask], y[val_mask]
 
     print(f"📊 Training samples: {len(X_train)}")
     print(f"📊 Validation samples: {len(X_val)}")
@@ -159,7 +162,7 @@ def build_model():
 
     return model
 
-def train_model():
+def train_model(resume=False, checkpoint_every=1):
     """Main training function"""
     # Try loading from CSV first
     X_train, X_val, y_train, y_val = load_data_from_csv()
@@ -182,8 +185,17 @@ def train_model():
             fill_mode='nearest'
         )
 
-    # Build model
-    model = build_model()
+    # Build model, or pick up an interrupted run
+    checkpoint_dir = training_state.checkpoint_dir('model_training')
+    model, state = training_state.load_checkpoint(checkpoint_dir) if resume else (None, None)
+    if model is None:
+        if resume:
+            print(f"⚠️  No checkpoint in {checkpoint_dir}, starting from scratch")
+        model = build_model()
+        initial_epoch = 0
+    else:
+        training_state.restore_rng(state)
+        initial_epoch = state['epoch']
 
     # Callbacks
     early_stopping = EarlyStopping(
@@ -201,6 +213,11 @@ def train_model():
         verbose=1
     )
 
+    checkpoint = training_state.CheckpointCallback(
+        checkpoint_dir, every=checkpoint_every,
+        callbacks=[early_stopping, reduce_lr], resume_state=state
+    )
+
     print("\n🎯 Starting training...")
 
     # Train model
@@ -209,7 +226,8 @@ def train_model():
             datagen.flow(X_train, y_train, batch_size=64),
             validation_data=(X_val, y_val),
             epochs=20,
-            callbacks=[early_stopping, reduce_lr],
+            initial_epoch=initial_epoch,
+            callbacks=[early_stopping, reduce_lr, checkpoint],
             verbose=1
         )
     else:
@@ -217,7 +235,8 @@ def train_model():
             train_data,
             validation_data=val_data,
             epochs=20,
-            callbacks=[early_stopping, reduce_lr],
+            initial_epoch=initial_epoch,
+            callbacks=[early_stopping, reduce_lr, checkpoint],
             verbose=1
         )
 
@@ -234,11 +253,129 @@ def train_model():
     print(f"\n📊 Final Validation Accuracy: {final_acc*100:.2f}%")
     print(f"📊 Final Validation Loss: {final_loss:.4f}")
 
+    # Register a versioned copy so running web workers can hot-swap to it,
+    # recording what it has seen so --fine-tune only trains on the delta
+    manifest = None
+    if use_csv:
+        manifest = training_state.manifest_files(training_state.sample_keys(X_train), y_train.argmax(axis=1))
+    model_registry.register_model(model, {
+        'script': 'model_training.py',
+        'data_source': 'csv' if use_csv else 'directory',
+        'val_accuracy': float(final_acc),
+        'val_loss': float(final_loss),
+        'epochs_trained': initial_epoch + len(history.history['loss']),
+        'train_samples': len(X_train) if use_csv else None,
+        'val_samples': len(X_val) if use_csv else None,
+        'img_size': IMG_SIZE,
+        'emotions': EMOTIONS
+    }, extra_files=manifest)
+
+    training_state.clear_checkpoint(checkpoint_dir)
+
+    return model, history
+
+def fine_tune_model(epochs=training_state.FINETUNE_EPOCHS, resume=False, checkpoint_every=1):
+    """Warm-start from the production model and train only on new or relabelled CSV rows"""
+    X_all, X_val, y_all, y_val = load_data_from_csv()
+    if X_all is None:
+        print("❌ Fine-tuning needs the CSV dataset")
+        return None, None
+
+    checkpoint_dir = training_state.checkpoint_dir('model_training-finetune')
+    model, state = training_state.load_checkpoint(checkpoint_dir) if resume else (None, None)
+    base_version = state['base_version'] if state else training_state.production_version()
+
+    # The delta is relative to the samples the base version itself was trained on
+    keys = training_state.sample_keys(X_all)
+    labels = y_all.argmax(axis=1)
+    delta, replay = training_state.select_delta(keys, labels, training_state.load_manifest(base_version))
+    print(f"\n📊 New or relabelled samples: {len(delta)} / {len(keys)} (+{len(replay)} replayed)")
+    if not delta:
+        print("✅ Production model is already trained on every sample; nothing to do")
+        return None, None
+
+    X_train, y_train = X_all[delta + replay], y_all[delta + replay]
+
+    if model is None:
+        model, base_version = training_state.load_production_model(base_version)
+        print(f"🔁 Fine-tuning production model {base_version}")
+        model.compile(
+            optimizer=Adam(learning_rate=training_state.FINETUNE_LEARNING_RATE),
+            loss='categorical_crossentropy',
+            metrics=['accuracy']
+        )
+        initial_epoch = 0
+    else:
+        training_state.restore_rng(state)
+        initial_epoch = state['epoch']
+
+    early_stopping = EarlyStopping(
+        monitor='val_loss',
+        patience=3,
+        restore_best_weights=True,
+        verbose=1
+    )
+
+    checkpoint = training_state.CheckpointCallback(
+        checkpoint_dir, every=checkpoint_every,
+        callbacks=[early_stopping], resume_state=state,
+        extra_state={'base_version': base_version}
+    )
+
+    print("\n🎯 Starting fine-tuning...")
+    history = model.fit(
+        X_train, y_train,
+        validation_data=(X_val, y_val),
+        batch_size=64,
+        epochs=epochs,
+        initial_epoch=initial_epoch,
+        callbacks=[early_stopping, checkpoint],
+        verbose=1
+    )
+
+    model.save('face_emotionModel.h5')
+    print("\n✅ Model fine-tuned and saved as face_emotionModel.h5")
+
+    final_loss, final_acc = model.evaluate(X_val, y_val, verbose=0)
+    print(f"\n📊 Final Validation Accuracy: {final_acc*100:.2f}%")
+    print(f"📊 Final Validation Loss: {final_loss:.4f}")
+
+    model_registry.register_model(model, {
+        'script': 'model_training.py',
+        'data_source': 'csv',
+        'fine_tuned_from': base_version,
+        'delta_samples': len(delta),
+        'replay_samples': len(replay),
+        'val_accuracy': float(final_acc),
+        'val_loss': float(final_loss),
+        'epochs_trained': initial_epoch + len(history.history['loss']),
+        'train_samples': len(X_all),
+        'val_samples': len(X_val),
+        'img_size': IMG_SIZE,
+        'emotions': EMOTIONS
+    }, extra_files=training_state.manifest_files(keys, labels))
+
+    training_state.clear_checkpoint(checkpoint_dir)
+
     return model, history
 
+def parse_args():
+    parser = argparse.ArgumentParser(description='Train the emotion detection model')
+    parser.add_argument('--fine-tune', action='store_true',
+                        help='Warm-start from the production model and train only on new or changed samples')
+    parser.add_argument('--resume', action='store_true',
+                        help='Continue an interrupted run from its last checkpoint')
+    parser.add_argument('--checkpoint-every', type=int, default=1, metavar='EPOCHS',
+                        help='Epochs between checkpoints (default: 1)')
+    return parser.parse_args()
+
 if __name__ == "__main__":
+    args = parse_args()
     try:
-        model, history = train_model()
+        if args.fine_tune:
+            model, history = fine_tune_model(resume=args.resume, checkpoint_every=args.checkpoint_every)
+        else:
+            model, history = train_model(resume=args.resume, checkpoint_every=args.checkpoint_every)
         print("\n🎉 Training completed successfully!")
     except Exception as e:
         print(f"\n❌ Error during training: {str(e)}")
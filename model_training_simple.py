@@ -15,14 +15,19 @@ print("Set backend to JAX", flush=True)
 import numpy as np
 import keras
 from keras.models import Sequential
-from keras.layers import Conv2D, MaxPooling2D, Flatten, Dense, Dropout, BatchNormalization
+from keras.layers import Conv2D, MaxPooling2D, Flatten, Dense, Dropout, BatchNormalization, GlobalAveragePooling2D
 from keras.callbacks import EarlyStopping, ReduceLROnPlateau
+from keras.optimizers import Adam
 from keras.utils import to_categorical
 from PIL import Image
 import glob
+import argparse
 import json
 import time
 from datetime import datetime
+import model_registry
+import cascade
+import training_state
 
 print("🚀 Starting Emotion Detection Model Training...", flush=True)
 print(f"Keras Version: {keras.__version__}", flush=True)
@@ -33,13 +38,17 @@ EMOTIONS = ['Angry', 'Disgust', 'Fear', 'Happy', 'Sad', 'Surprise', 'Neutral']
 IMG_SIZE = 48
 BATCH_SIZE = 64
 EPOCHS = 20
+TRAIN_DIR = 'data/data/subset/train'
+VAL_DIR = 'data/data/subset/test'
 
 class TrainingMonitorCallback(keras.callbacks.Callback):
     """Custom callback to save training progress to JSON file for web monitoring"""
 
-    def __init__(self, filepath='training_progress.json'):
+    def __init__(self, filepath='training_progress.json', total_epochs=EPOCHS, resume=False):
         super().__init__()
         self.filepath = filepath
+        self.total_epochs = total_epochs
+        self.resume = resume
         self.start_time = None
 
     def on_train_begin(self, logs=None):
@@ -48,7 +57,7 @@ class TrainingMonitorCallback(keras.callbacks.Callback):
         progress = {
             'status': 'training',
             'start_time': datetime.now().isoformat(),
-            'total_epochs': EPOCHS,
+            'total_epochs': self.total_epochs,
             'current_epoch': 0,
             'epochs_completed': 0,
             'history': {
@@ -73,6 +82,13 @@ class TrainingMonitorCallback(keras.callbacks.Callback):
             'estimated_time_remaining': None,
             'elapsed_time': 0
         }
+
+        # A resumed run continues the history of the interrupted one
+        previous = self._load_progress() if self.resume else {}
+        if previous.get('history'):
+            progress['history'] = previous['history']
+            progress['start_time'] = previous.get('start_time', progress['start_time'])
+
         self._save_progress(progress)
 
     def on_epoch_begin(self, epoch, logs=None):
@@ -104,7 +120,7 @@ class TrainingMonitorCallback(keras.callbacks.Callback):
 
         if epoch > 0:
             avg_time_per_epoch = elapsed / (epoch + 1)
-            remaining_epochs = EPOCHS - (epoch + 1)
+            remaining_epochs = self.total_epochs - (epoch + 1)
             progress['estimated_time_remaining'] = int(avg_time_per_epoch * remaining_epochs)
 
         # Latest metrics
@@ -187,8 +203,8 @@ def load_data():
     print("LOADING DATA")
     print("="*70)
 
-    train_dir = 'data/data/subset/train'
-    val_dir = 'data/data/subset/test'
+    train_dir = TRAIN_DIR
+    val_dir = VAL_DIR
 
     print(f"Train directory: {train_dir}")
     print(f"Val directory: {val_dir}")
@@ -210,7 +226,7 @@ def load_data():
 
     return X_train, y_train, X_val, y_val
 
-def build_model():
+def build_model(conv_dropout=0.25, dense_dropout=0.5, learning_rate=0.001):
     """Build CNN model for emotion detection"""
     print("\n" + "="*70)
     print("BUILDING MODEL")
@@ -223,7 +239,7 @@ def build_model():
         Conv2D(64, (3, 3), activation='relu', padding='same'),
         BatchNormalization(),
         MaxPooling2D(pool_size=(2, 2)),
-        Dropout(0.25),
+        Dropout(conv_dropout),
 
         # Second Convolutional Block
         Conv2D(128, (3, 3), activation='relu', padding='same'),
@@ -231,7 +247,7 @@ def build_model():
         Conv2D(128, (3, 3), activation='relu', padding='same'),
         BatchNormalization(),
         MaxPooling2D(pool_size=(2, 2)),
-        Dropout(0.25),
+        Dropout(conv_dropout),
 
         # Third Convolutional Block
         Conv2D(256, (3, 3), activation='relu', padding='same'),
@@ -239,21 +255,21 @@ def build_model():
         Conv2D(256, (3, 3), activation='relu', padding='same'),
         BatchNormalization(),
         MaxPooling2D(pool_size=(2, 2)),
-        Dropout(0.25),
+        Dropout(conv_dropout),
 
         # Fully Connected Layers
         Flatten(),
         Dense(512, activation='relu'),
         BatchNormalization(),
-        Dropout(0.5),
+        Dropout(dense_dropout),
         Dense(256, activation='relu'),
         BatchNormalization(),
-        Dropout(0.5),
+        Dropout(dense_dropout),
         Dense(7, activation='softmax')  # 7 emotion classes
     ])
 
     model.compile(
-        optimizer='adam',
+        optimizer=Adam(learning_rate=learning_rate),
         loss='categorical_crossentropy',
         metrics=['accuracy']
     )
@@ -264,16 +280,25 @@ def build_model():
 
     return model
 
-def train_model():
+def train_model(resume=False, checkpoint_every=1):
     """Main training function"""
     # Load data
     X_train, y_train, X_val, y_val = load_data()
 
-    # Build model
-    model = build_model()
+    # Build model, or pick up an interrupted run
+    checkpoint_dir = training_state.checkpoint_dir('model_training_simple')
+    model, state = training_state.load_checkpoint(checkpoint_dir) if resume else (None, None)
+    if model is None:
+        if resume:
+            print(f"⚠️  No checkpoint in {checkpoint_dir}, starting from scratch")
+        model = build_model()
+        initial_epoch = 0
+    else:
+        training_state.restore_rng(state)
+        initial_epoch = state['epoch']
 
     # Callbacks
-    monitor_callback = TrainingMonitorCallback('training_progress.json')
+    monitor_callback = TrainingMonitorCallback('training_progress.json', resume=state is not None)
 
     early_stopping = EarlyStopping(
         monitor='val_loss',
@@ -290,14 +315,20 @@ def train_model():
         verbose=1
     )
 
+    checkpoint = training_state.CheckpointCallback(
+        checkpoint_dir, every=checkpoint_every,
+        callbacks=[early_stopping, reduce_lr], resume_state=state
+    )
+
     # Train model
     print("\n" + "="*70)
     print("TRAINING MODEL")
     print("="*70)
-    print(f"Epochs: {EPOCHS}")
+    print(f"Epochs: {EPOCHS}" + (f" (resuming after epoch {initial_epoch})" if initial_epoch else ""))
     print(f"Batch size: {BATCH_SIZE}")
     print(f"Early stopping patience: 10")
     print(f"Learning rate reduction patience: 5")
+    print(f"Checkpoint every {checkpoint_every} epoch(s) to {checkpoint_dir}/")
     print()
 
     history = model.fit(
@@ -305,7 +336,8 @@ def train_model():
         validation_data=(X_val, y_val),
         batch_size=BATCH_SIZE,
         epochs=EPOCHS,
-        callbacks=[monitor_callback, early_stopping, reduce_lr],
+        initial_epoch=initial_epoch,
+        callbacks=[monitor_callback, early_stopping, reduce_lr, checkpoint],
         verbose=1
     )
 
@@ -327,11 +359,234 @@ def train_model():
     print(f"📊 Final Validation Accuracy: {final_acc*100:.2f}%")
     print(f"📊 Final Validation Loss: {final_loss:.4f}")
 
+    # Register a versioned copy so running web workers can hot-swap to it,
+    # recording what it has seen so --fine-tune only trains on the delta
+    model_registry.register_model(model, {
+        'script': 'model_training_simple.py',
+        'val_accuracy': float(final_acc),
+        'val_loss': float(final_loss),
+        'epochs_trained': initial_epoch + len(history.history['loss']),
+        'train_samples': len(X_train),
+        'val_samples': len(X_val),
+        'batch_size': BATCH_SIZE,
+        'img_size': IMG_SIZE,
+        'emotions': EMOTIONS
+    }, extra_files=training_state.manifest_files(training_state.sample_keys(X_train), y_train.argmax(axis=1)))
+
+    training_state.clear_checkpoint(checkpoint_dir)
+
     return model, history
 
+def fine_tune_model(epochs=training_state.FINETUNE_EPOCHS, resume=False, checkpoint_every=1):
+    """Warm-start from the production model and train only on new or relabelled samples
+
+    Samples are matched by content hash against the training_manifest.json
+    that every full training run and fine-tune registers with its model
+    version, so the delta is always relative to the model being tuned. A
+    replay of old samples is mixed in so earlier classes are not forgotten.
+    """
+    X_all, y_all, X_val, y_val = load_data()
+    checkpoint_dir = training_state.checkpoint_dir('model_training_simple-finetune')
+    model, state = training_state.load_checkpoint(checkpoint_dir) if resume else (None, None)
+    base_version = state['base_version'] if state else training_state.production_version()
+
+    keys = training_state.sample_keys(X_all)
+    labels = y_all.argmax(axis=1)
+
+    delta, replay = training_state.select_delta(keys, labels, training_state.load_manifest(base_version))
+    print(f"\n📊 New or relabelled samples: {len(delta)} / {len(keys)} (+{len(replay)} replayed)")
+    if not delta:
+        print("✅ Production model is already trained on every sample; nothing to do")
+        return None, None
+
+    X_train, y_train = X_all[delta + replay], y_all[delta + replay]
+
+    if model is None:
+        model, base_version = training_state.load_production_model(base_version)
+        print(f"🔁 Fine-tuning production model {base_version}")
+        model.compile(
+            optimizer=Adam(learning_rate=training_state.FINETUNE_LEARNING_RATE),
+            loss='categorical_crossentropy',
+            metrics=['accuracy']
+        )
+        initial_epoch = 0
+    else:
+        training_state.restore_rng(state)
+        initial_epoch = state['epoch']
+
+    early_stopping = EarlyStopping(
+        monitor='val_loss',
+        patience=3,
+        restore_best_weights=True,
+        verbose=1
+    )
+
+    checkpoint = training_state.CheckpointCallback(
+        checkpoint_dir, every=checkpoint_every,
+        callbacks=[early_stopping], resume_state=state,
+        extra_state={'base_version': base_version}
+    )
+
+    print("\n" + "="*70)
+    print("FINE-TUNING MODEL")
+    print("="*70)
+
+    history = model.fit(
+        X_train, y_train,
+        validation_data=(X_val, y_val),
+        batch_size=BATCH_SIZE,
+        epochs=epochs,
+        initial_epoch=initial_epoch,
+        callbacks=[
+            TrainingMonitorCallback('training_progress.json', total_epochs=epochs, resume=state is not None),
+            early_stopping,
+            checkpoint
+        ],
+        verbose=1
+    )
+
+    model.save('face_emotionModel.h5')
+    print("✅ Model saved as face_emotionModel.h5")
+
+    final_loss, final_acc = model.evaluate(X_val, y_val, verbose=0)
+    print(f"📊 Final Validation Accuracy: {final_acc*100:.2f}%")
+    print(f"📊 Final Validation Loss: {final_loss:.4f}")
+
+    model_registry.register_model(model, {
+        'script': 'model_training_simple.py',
+        'fine_tuned_from': base_version,
+        'delta_samples': len(delta),
+        'replay_samples': len(replay),
+        'val_accuracy': float(final_acc),
+        'val_loss': float(final_loss),
+        'epochs_trained': initial_epoch + len(history.history['loss']),
+        'train_samples': len(X_all),
+        'val_samples': len(X_val),
+        'batch_size': BATCH_SIZE,
+        'img_size': IMG_SIZE,
+        'emotions': EMOTIONS
+    }, extra_files=training_state.manifest_files(keys, labels))
+
+    training_state.clear_checkpoint(checkpoint_dir)
+
+    return model, history
+
+def build_fast_model():
+    """Build the small first-stage CNN used by cascade mode (~25K parameters)"""
+    print("\n" + "="*70)
+    print("BUILDING FAST MODEL")
+    print("="*70)
+
+    model = Sequential([
+        Conv2D(16, (3, 3), activation='relu', padding='same', input_shape=(IMG_SIZE, IMG_SIZE, 1)),
+        BatchNormalization(),
+        MaxPooling2D(pool_size=(2, 2)),
+
+        Conv2D(32, (3, 3), activation='relu', padding='same'),
+        BatchNormalization(),
+        MaxPooling2D(pool_size=(2, 2)),
+
+        Conv2D(64, (3, 3), activation='relu', padding='same'),
+        BatchNormalization(),
+        MaxPooling2D(pool_size=(2, 2)),
+
+        GlobalAveragePooling2D(),
+        Dropout(0.25),
+        Dense(7, activation='softmax')  # 7 emotion classes
+    ])
+
+    model.compile(
+        optimizer='adam',
+        loss='categorical_crossentropy',
+        metrics=['accuracy']
+    )
+
+    print("✅ Fast model built successfully!")
+    model.summary()
+
+    return model
+
+def train_fast_model():
+    """Train the cascade's first-stage model and calibrate its confidence threshold
+
+    Calibration is against the production (active) full model, so train that
+    first. The fast model and threshold are stored in its registry version.
+    """
+    try:
+        full_model, version = training_state.load_production_model()
+    except (OSError, ValueError) as e:
+        print(f"⚠️  Could not load the production model ({e}); train the full model, then rerun with --fast")
+        return None, None
+
+    X_train, y_train, X_val, y_val = load_data()
+    # Fit and calibrate on one half of the validation set only; cascade.py
+    # reports accuracy on the other half
+    calibration_idx, _ = cascade.split_validation(len(X_val))
+    X_val, y_val = X_val[calibration_idx], y_val[calibration_idx]
+    model = build_fast_model()
+
+    early_stopping = EarlyStopping(
+        monitor='val_loss',
+        patience=10,
+        restore_best_weights=True,
+        verbose=1
+    )
+
+    print("\n" + "="*70)
+    print("TRAINING FAST MODEL")
+    print("="*70)
+
+    model.fit(
+        X_train, y_train,
+        validation_data=(X_val, y_val),
+        batch_size=BATCH_SIZE,
+        epochs=EPOCHS,
+        callbacks=[early_stopping],
+        verbose=1
+    )
+
+    print("\n" + "="*70)
+    print(f"CALIBRATING CASCADE THRESHOLD AGAINST MODEL {version}")
+    print("="*70)
+
+    labels = y_val.argmax(axis=1)
+    calibration = cascade.calibrate_threshold(
+        model.predict(X_val, verbose=0),
+        full_model.predict(X_val, verbose=0),
+        labels
+    )
+    cascade.save_cascade(model, calibration, version)
+
+    print(f"📊 Threshold: {calibration['threshold']:.3f}")
+    print(f"📊 Handled by fast model: {calibration['fast_fraction']*100:.1f}% of calibration samples")
+    print(f"📊 Cascade accuracy on calibration samples: {calibration['cascade_accuracy']*100:.2f}% "
+          f"(full model {calibration['full_accuracy']*100:.2f}%); run cascade.py for held-out accuracy")
+    print(f"✅ Fast model and calibration saved to {cascade.fast_model_path(version)} "
+          f"and {cascade.config_path(version)}")
+
+    return model, calibration
+
+def parse_args():
+    parser = argparse.ArgumentParser(description='Train the emotion detection model')
+    parser.add_argument('--fast', action='store_true',
+                        help='Train the small first-stage model for cascade mode and calibrate it')
+    parser.add_argument('--fine-tune', action='store_true',
+                        help='Warm-start from the production model and train only on new or changed samples')
+    parser.add_argument('--resume', action='store_true',
+                        help='Continue an interrupted run from its last checkpoint')
+    parser.add_argument('--checkpoint-every', type=int, default=1, metavar='EPOCHS',
+                        help='Epochs between checkpoints (default: 1)')
+    return parser.parse_args()
+
 if __name__ == "__main__":
+    args = parse_args()
     try:
-        model, history = train_model()
+        if args.fast:
+            model, calibration = train_fast_model()
+        elif args.fine_tune:
+            model, history = fine_tune_model(resume=args.resume, checkpoint_every=args.checkpoint_every)
+        else:
+            model, history = train_model(resume=args.resume, checkpoint_every=args.checkpoint_every)
         print("\n🎉 Training completed successfully!")
     except Exception as e:
         print(f"\n❌ Error during training: {str(e)}")
@@ -0,0 +1,160 @@
+# profiling.py
+"""
+Opt-in profiling for the web app
+StartupReport times the phases of app start-up (imports, Keras/JAX backend
+initialisation, model load, warm-up). SamplingProfiler samples one thread's
+Python stack at a fixed interval while a request runs. Samples with a JAX or
+jaxlib frame on the stack are counted as time in JAX dispatch, which includes
+XLA execution started from Python. ProfileStore keeps recent request profiles
+for the admin endpoint.
+"""
+
+import os
+import sys
+import threading
+import time
+import uuid
+from collections import Counter, deque
+from datetime import datetime
+
+PROFILE_INTERVAL = float(os.environ.get('PROFILE_INTERVAL_MS', 2)) / 1000
+PROFILE_MAX_STORED = int(os.environ.get('PROFILE_MAX_STORED', 50))
+
+JAX_PATH_MARKERS = (f'{os.sep}jax{os.sep}', f'{os.sep}jaxlib{os.sep}', f'{os.sep}jax_plugins{os.sep}')
+
+
+def _frame_label(frame):
+    code = frame.f_code
+    module = frame.f_globals.get('__name__', os.path.basename(code.co_filename))
+    return f'{module}:{code.co_name}'
+
+
+class StartupReport:
+    """Wall-clock time of each start-up phase, measured from construction"""
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        self._last = self.started
+        self.phases = {}
+
+    def mark(self, phase):
+        """Record the time since the previous mark as `phase`"""
+        now = time.perf_counter()
+        self.record(phase, now - self._last)
+        self._last = now
+
+    def record(self, phase, seconds):
+        self.phases[phase] = self.phases.get(phase, 0.0) + seconds
+
+    def as_dict(self):
+        return {
+            'phases_ms': {phase: round(seconds * 1000, 1) for phase, seconds in self.phases.items()},
+            'total_ms': round((self._last - self.started) * 1000, 1)
+        }
+
+    def print(self):
+        report = self.as_dict()
+        print("⏱️  Startup: " + ", ".join(f"{phase} {ms:.0f} ms" for phase, ms in report['phases_ms'].items())
+              + f" (total {report['total_ms']:.0f} ms)")
+
+
+class SamplingProfiler:
+    """Sample the calling thread's stack from a background thread
+
+    Use as a context manager around the work to profile. The sampler needs the
+    GIL to read the stack. Samples taken while the thread is inside C code
+    that released the GIL (XLA, OpenCV, SQLite) show the Python frame that
+    called into it.
+    """
+
+    def __init__(self, interval=PROFILE_INTERVAL):
+        self.interval = interval
+        self.stacks = Counter()
+        self.samples = 0
+        self.jax_samples = 0
+        self.duration = 0.0
+        self._thread_id = None
+        self._stop = threading.Event()
+        self._sampler = None
+
+    def __enter__(self):
+        self._thread_id = threading.get_ident()
+        self._start = time.perf_counter()
+        self._sampler = threading.Thread(target=self._run, name='profile-sampler', daemon=True)
+        self._sampler.start()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.duration = time.perf_counter() - self._start
+        self._stop.set()
+        self._sampler.join()
+        return False
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            frame = sys._current_frames().get(self._thread_id)
+            if frame is None:
+                continue
+            stack, in_jax = [], False
+            while frame is not None:
+                stack.append(_frame_label(frame))
+                in_jax = in_jax or any(marker in frame.f_code.co_filename for marker in JAX_PATH_MARKERS)
+                frame = frame.f_back
+            self.stacks[';'.join(reversed(stack))] += 1
+            self.samples += 1
+            self.jax_samples += in_jax
+
+    def summary(self, top=15):
+        """Sample counts per innermost function and per collapsed stack (flamegraph input)"""
+        per_sample = self.duration / self.samples if self.samples else 0.0
+        functions = Counter()
+        for stack, count in self.stacks.items():
+            functions[stack.rsplit(';', 1)[-1]] += count
+        return {
+            'duration_ms': round(self.duration * 1000, 2),
+            'interval_ms': self.interval * 1000,
+            'samples': self.samples,
+            'jax_ms': round(self.jax_samples * per_sample * 1000, 2),
+            'jax_fraction': round(self.jax_samples / self.samples, 3) if self.samples else 0.0,
+            'top_functions': [
+                {'function': name, 'samples': count, 'ms': round(count * per_sample * 1000, 2)}
+                for name, count in functions.most_common(top)
+            ],
+            'stacks': dict(self.stacks.most_common())
+        }
+
+
+class ProfileStore:
+    """The most recent request profiles, thread-safe"""
+
+    def __init__(self, max_entries=PROFILE_MAX_STORED):
+        self.max_entries = max_entries
+        self._profiles = deque(maxlen=max_entries)
+        self._lock = threading.Lock()
+
+    def add(self, path, profiler, **extra):
+        entry = {
+            'id': uuid.uuid4().hex[:12],
+            'path': path,
+            'recorded_at': datetime.now().isoformat(),
+            **extra,
+            **profiler.summary()
+        }
+        with self._lock:
+            self._profiles.append(entry)
+        return entry['id']
+
+    def slowest(self, limit=20, min_ms=0):
+        """Stored profiles, slowest first, without their full stacks"""
+        with self._lock:
+            profiles = list(self._profiles)
+        profiles = [p for p in profiles if p['duration_ms'] >= min_ms]
+        profiles.sort(key=lambda p: p['duration_ms'], reverse=True)
+        return [{k: v for k, v in p.items() if k != 'stacks'} for p in profiles[:limit]]
+
+    def get(self, profile_id):
+        with self._lock:
+            for profile in self._profiles:
+                if profile['id'] == profile_id:
+                    return profile
+        return None
@@ -0,0 +1,232 @@
+# prune_model.py
+"""
+Structured pruning for the emotion CNN
+Removes the least important convolution filters and dense units from a trained
+face_emotionModel.h5 and rebuilds the network with the surviving weights, so
+the pruned model is physically smaller (fewer filters / units, smaller files)
+rather than the same shape with zeroed weights. Each pruned model is
+fine-tuned briefly, then a sweep report compares parameter count, file size,
+CPU latency and validation accuracy against the original.
+
+Usage:
+    python prune_model.py                          # ratios 0.25, 0.5, 0.75
+    python prune_model.py --ratios 0.3,0.5 --finetune-epochs 5
+"""
+
+# Set Keras backend to JAX (compatible with Python 3.14)
+import os
+os.environ['KERAS_BACKEND'] = 'jax'
+
+import argparse
+import json
+import math
+import tempfile
+
+import numpy as np
+from keras.models import Sequential, load_model
+from keras.layers import Input, Conv2D, Dense, BatchNormalization, Flatten
+from keras.optimizers import Adam
+from keras.callbacks import EarlyStopping
+
+from model_training_simple import load_data, IMG_SIZE, BATCH_SIZE, EMOTIONS
+from distill_model import measure
+import cascade
+import model_registry
+
+SOURCE_PATH = 'face_emotionModel.h5'
+REPORT_PATH = 'pruning_report.json'
+FINETUNE_LEARNING_RATE = 1e-4
+
+
+def _following_batchnorm(layers, index):
+    """The BatchNormalization layer directly after layers[index], if any"""
+    if index + 1 < len(layers) and isinstance(layers[index + 1], BatchNormalization):
+        return layers[index + 1]
+    return None
+
+
+def unit_importance(kernel, batchnorm=None):
+    """L1 norm of each output filter / unit, scaled by the following BatchNorm's gain
+
+    Pass the kernel already sliced to the surviving input channels, so weights
+    from inputs pruned upstream do not count.
+
+    A channel whose BatchNorm scale |gamma| / sqrt(var) is near zero contributes
+    little downstream however large its weights are.
+    """
+    importance = np.abs(kernel).reshape(-1, kernel.shape[-1]).sum(axis=0)
+    if batchnorm is not None:
+        gamma, _, _, variance = batchnorm.get_weights()
+        importance *= np.abs(gamma) / np.sqrt(variance + batchnorm.epsilon)
+    return importance
+
+
+def prune_model(model, ratio):
+    """Return a new Sequential model with `ratio` of every conv's filters and hidden dense units removed
+
+    The output layer keeps all classes. Works on Sequential models built from
+    Conv2D / Dense / BatchNormalization / Flatten and shape-preserving layers
+    (pooling, dropout), which covers both training scripts' architectures.
+    """
+    layers = model.layers
+    output_layer = layers[-1]
+    new_layers, new_weights = [], []
+    keep = None   # Indices of surviving channels / features feeding the current layer
+
+    for i, layer in enumerate(layers):
+        config = layer.get_config()
+        weights = layer.get_weights()
+
+        if isinstance(layer, (Conv2D, Dense)):
+            kernel, *bias = weights
+            if keep is not None:
+                kernel = kernel[..., keep, :]
+
+            if layer is output_layer:
+                keep = None
+            else:
+                importance = unit_importance(kernel, _following_batchnorm(layers, i))
+                n_keep = max(1, math.ceil(kernel.shape[-1] * (1 - ratio)))
+                keep = np.sort(np.argsort(-importance)[:n_keep])
+                kernel = kernel[..., keep]
+                bias = [b[keep] for b in bias]
+                config['filters' if isinstance(layer, Conv2D) else 'units'] = len(keep)
+            weights = [kernel, *bias]
+
+        elif isinstance(layer, BatchNormalization):
+            if keep is not None:
+                weights = [w[keep] for w in weights]
+
+        elif isinstance(layer, Flatten):
+            if keep is not None:
+                # Channels-last flatten: feature index = spatial position * channels + channel
+                _, height, width, channels = layer.input.shape
+                positions = np.arange(height * width)[:, None] * channels
+                keep = (positions + keep[None, :]).ravel()
+
+        new_layers.append(layer.__class__.from_config(config))
+        new_weights.append(weights)
+
+    pruned = Sequential([Input(shape=(IMG_SIZE, IMG_SIZE, 1)), *new_layers])
+    for layer, weights in zip(pruned.layers, new_weights):
+        layer.set_weights(weights)
+    return pruned
+
+
+def finetune(model, X_train, y_train, X_val, y_val, epochs):
+    """Briefly retrain a pruned model at a low learning rate"""
+    model.compile(
+        optimizer=Adam(learning_rate=FINETUNE_LEARNING_RATE),
+        loss='categorical_crossentropy',
+        metrics=['accuracy']
+    )
+    if epochs > 0:
+        model.fit(
+            X_train, y_train,
+            validation_data=(X_val, y_val),
+            batch_size=BATCH_SIZE,
+            epochs=epochs,
+            callbacks=[EarlyStopping(monitor='val_accuracy', patience=3,
+                                     restore_best_weights=True, verbose=1)],
+            verbose=1
+        )
+    return model
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description='Prune conv filters and dense units from the trained model')
+    parser.add_argument('--model', default=SOURCE_PATH, help='Model to prune')
+    parser.add_argument('--ratios', default='0.25,0.5,0.75',
+                        help='Comma-separated fractions of filters / units to remove')
+    parser.add_argument('--finetune-epochs', type=int, default=3)
+    parser.add_argument('--register', action='store_true',
+                        help='Add each pruned model to the model registry (not activated)')
+    return parser.parse_args()
+
+
+def main():
+    args = parse_args()
+    ratios = [float(r) for r in args.ratios.split(',') if r.strip()]
+    if any(not 0 <= r < 1 for r in ratios):
+        raise SystemExit("❌ Pruning ratios must be in [0, 1)")
+
+    if not os.path.exists(args.model):
+        raise SystemExit(f"❌ Model {args.model} not found. Train it first.")
+
+    X_train, y_train, X_val, y_val = load_data()
+
+    # Fine-tuning early-stops on one half of the validation set and every
+    # model is reported on the other, so the fine-tuned rows are not in-sample
+    select_idx, report_idx = cascade.split_validation(len(X_val))
+    X_select, y_select = X_val[select_idx], y_val[select_idx]
+    X_report, y_report = X_val[report_idx], y_val[report_idx]
+
+    print(f"\n✂️ Loading {args.model}...")
+    original = load_model(args.model)
+
+    # Training saved the original with its optimizer state; measure it as
+    # served, the same way the pruned models are saved
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        serving_path = os.path.join(tmp_dir, 'original.h5')
+        original.save(serving_path, include_optimizer=False)
+        original_stats = measure(original, serving_path, X_report, y_report)
+
+    report = {
+        'source': args.model,
+        'finetune_epochs': args.finetune_epochs,
+        'report_samples': int(len(report_idx)),
+        'models': {'original': original_stats}
+    }
+
+    for ratio in ratios:
+        name = f'pruned_{int(round(ratio * 100))}'
+        print("\n" + "="*70)
+        print(f"PRUNING {ratio * 100:.0f}% OF FILTERS / UNITS")
+        print("="*70)
+
+        pruned = prune_model(original, ratio)
+        pruned.compile(optimizer='adam', loss='categorical_crossentropy', metrics=['accuracy'])
+        _, accuracy_before = pruned.evaluate(X_report, y_report, verbose=0)
+        print(f"Accuracy before fine-tuning: {accuracy_before * 100:.2f}%")
+
+        finetune(pruned, X_train, y_train, X_select, y_select, args.finetune_epochs)
+
+        path = f'face_emotionModel_{name}.h5'
+        pruned.save(path, include_optimizer=False)
+        print(f"✅ Pruned model saved as {path}")
+
+        stats = measure(pruned, path, X_report, y_report)
+        stats['ratio'] = ratio
+        stats['val_accuracy_before_finetune'] = float(accuracy_before)
+        report['models'][name] = stats
+
+        if args.register:
+            model_registry.register_model(pruned, {
+                'script': 'prune_model.py',
+                'source': args.model,
+                'pruning_ratio': ratio,
+                'finetune_epochs': args.finetune_epochs,
+                'val_accuracy': stats['val_accuracy'],
+                'img_size': IMG_SIZE,
+                'emotions': EMOTIONS
+            }, activate=False)
+
+    print("\n" + "="*70)
+    print("PRUNING SWEEP (held-out validation half)")
+    print("="*70)
+    original_stats = report['models']['original']
+    print(f"{'Model':<12} {'Params':>10} {'Size MB':>8} {'Mean ms':>8} {'p99 ms':>8} "
+          f"{'Accuracy':>9} {'Speedup':>8}")
+    for name, stats in report['models'].items():
+        print(f"{name:<12} {stats['params']:>10,} {stats['file_size_mb']:>8.2f} "
+              f"{stats['latency_mean_ms']:>8.2f} {stats['latency_p99_ms']:>8.2f} "
+              f"{stats['val_accuracy'] * 100:>8.2f}% "
+              f"{original_stats['latency_mean_ms'] / stats['latency_mean_ms']:>7.1f}x")
+
+    with open(REPORT_PATH, 'w') as f:
+        json.dump(report, f, indent=2)
+    print(f"\n✅ Report saved to {REPORT_PATH}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,279 @@
+# sweep.py
+"""
+Parallel hyperparameter sweep for the emotion CNN
+Decodes the training images once into .npy files that every trial process
+memory-maps, so N parallel trials share one copy of the dataset in the page
+cache instead of each re-reading and decoding the images. Trials run over a
+grid or a random sample of SEARCH_SPACE. Trials whose best validation
+accuracy falls below the median of the other trials at the same epoch are
+pruned early. Results go to a leaderboard of accuracy against wall-clock time
+and model size.
+
+Usage:
+    python sweep.py --search random --trials 12 --workers 3
+    python sweep.py --search grid --param batch_size=32,64 --param learning_rate=0.001,0.0005
+"""
+
+# Set Keras backend to JAX (compatible with Python 3.14)
+import os
+os.environ['KERAS_BACKEND'] = 'jax'
+
+import argparse
+import csv
+import hashlib
+import itertools
+import json
+import multiprocessing
+import random
+import statistics
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from datetime import datetime
+
+import numpy as np
+
+from model_training_simple import EPOCHS, TRAIN_DIR, VAL_DIR
+
+SWEEP_DIR = 'sweeps'
+CACHE_DIR = os.path.join(SWEEP_DIR, 'dataset_cache')
+ARRAYS = ('X_train', 'y_train', 'X_val', 'y_val')
+
+# Values tried for each hyperparameter; --param narrows any of them
+SEARCH_SPACE = {
+    'batch_size': [32, 64, 128],
+    'learning_rate': [0.001, 0.0005, 0.0002],
+    'conv_dropout': [0.15, 0.25, 0.35],
+    'dense_dropout': [0.3, 0.5],
+    'early_stopping_patience': [5, 10],
+    'reduce_lr_patience': [3, 5],
+}
+
+# A trial is only compared against the others once it has run this many epochs
+PRUNE_MIN_EPOCHS = 3
+
+
+def dataset_signature(*directories):
+    """Hash of every image path, size and mtime, so the cache is rebuilt when the data changes"""
+    digest = hashlib.sha1()
+    for directory in directories:
+        for root, _, files in sorted(os.walk(directory)):
+            for name in sorted(files):
+                stat = os.stat(os.path.join(root, name))
+                digest.update(f'{root}/{name}:{stat.st_size}:{stat.st_mtime_ns}\n'.encode())
+    return digest.hexdigest()
+
+
+def build_cache(cache_dir=CACHE_DIR):
+    """Decode the dataset to .npy files once; reused while the image directories are unchanged"""
+    signature = dataset_signature(TRAIN_DIR, VAL_DIR)
+    meta_path = os.path.join(cache_dir, 'meta.json')
+    try:
+        with open(meta_path) as f:
+            if json.load(f)['signature'] == signature:
+                print(f"📦 Using decoded dataset cache in {cache_dir}/")
+                return
+    except (FileNotFoundError, KeyError, ValueError):
+        pass
+
+    from model_training_simple import load_data
+    os.makedirs(cache_dir, exist_ok=True)
+    for name, array in zip(ARRAYS, load_data()):
+        np.save(os.path.join(cache_dir, f'{name}.npy'), np.ascontiguousarray(array, dtype='float32'))
+    with open(meta_path, 'w') as f:
+        json.dump({'signature': signature, 'created_at': datetime.now().isoformat()}, f)
+    print(f"📦 Decoded dataset cached in {cache_dir}/")
+
+
+def load_cache(cache_dir=CACHE_DIR):
+    """Memory-map the cached arrays (read-only, shared between processes)"""
+    return [np.load(os.path.join(cache_dir, f'{name}.npy'), mmap_mode='r') for name in ARRAYS]
+
+
+def make_trials(search, space, n_trials, seed=42):
+    """List of hyperparameter dicts: the full grid, or n_trials random draws without repeats"""
+    names = list(space)
+    grid = [dict(zip(names, values)) for values in itertools.product(*(space[n] for n in names))]
+    if search == 'grid':
+        return grid[:n_trials] if n_trials else grid
+    rng = random.Random(seed)
+    return rng.sample(grid, min(n_trials or 10, len(grid)))
+
+
+def run_trial(trial_id, params, cache_dir, epochs, progress):
+    """Train one configuration in a worker process; returns its leaderboard row"""
+    import keras
+    from keras.callbacks import EarlyStopping, ReduceLROnPlateau
+    from model_training_simple import build_model
+
+    class MedianPruning(keras.callbacks.Callback):
+        """Stop the trial when its best val accuracy is below the median of the other trials at this epoch"""
+
+        def __init__(self):
+            super().__init__()
+            self.best = 0.0
+            self.pruned_at = None
+
+        def on_epoch_end(self, epoch, logs=None):
+            self.best = max(self.best, float(logs.get('val_accuracy', 0)))
+            progress[trial_id] = list(progress.get(trial_id, [])) + [self.best]
+            if epoch + 1 < PRUNE_MIN_EPOCHS or epoch + 1 >= self.params['epochs']:
+                return
+            others = [curve[epoch] for other, curve in progress.items()
+                      if other != trial_id and len(curve) > epoch]
+            if len(others) >= 2 and self.best < statistics.median(others):
+                self.pruned_at = epoch + 1
+                self.model.stop_training = True
+
+    X_train, y_train, X_val, y_val = load_cache(cache_dir)
+    keras.utils.set_random_seed(trial_id)
+
+    start = time.time()
+    model = build_model(
+        conv_dropout=params['conv_dropout'],
+        dense_dropout=params['dense_dropout'],
+        learning_rate=params['learning_rate']
+    )
+    pruning = MedianPruning()
+    history = model.fit(
+        X_train, y_train,
+        validation_data=(X_val, y_val),
+        batch_size=params['batch_size'],
+        epochs=epochs,
+        callbacks=[
+            EarlyStopping(monitor='val_loss', patience=params['early_stopping_patience'],
+                          restore_best_weights=True),
+            ReduceLROnPlateau(monitor='val_loss', factor=0.5, patience=params['reduce_lr_patience'],
+                              min_lr=1e-7),
+            pruning
+        ],
+        verbose=0
+    )
+    wall_clock = time.time() - start
+
+    # Size of the model as it would be served (no optimizer state)
+    fd, path = tempfile.mkstemp(suffix='.h5')
+    os.close(fd)
+    try:
+        model.save(path, include_optimizer=False)
+        size_mb = os.path.getsize(path) / 1024 / 1024
+    finally:
+        os.remove(path)
+
+    return {
+        'trial': trial_id,
+        'status': 'pruned' if pruning.pruned_at else 'completed',
+        'val_accuracy': max(history.history['val_accuracy']),
+        'epochs': len(history.history['loss']),
+        'wall_clock_s': round(wall_clock, 1),
+        'params': int(model.count_params()),
+        'size_mb': round(size_mb, 2),
+        **params
+    }
+
+
+def mark_pareto(rows):
+    """Flag trials not beaten on both accuracy and wall-clock time by another trial"""
+    for row in rows:
+        row['pareto'] = not any(
+            other['val_accuracy'] >= row['val_accuracy'] and other['wall_clock_s'] <= row['wall_clock_s']
+            and (other['val_accuracy'], other['wall_clock_s']) != (row['val_accuracy'], row['wall_clock_s'])
+            for other in rows
+        )
+
+
+def write_leaderboard(rows, sweep_dir):
+    rows = sorted(rows, key=lambda r: r['val_accuracy'], reverse=True)
+    mark_pareto(rows)
+    for rank, row in enumerate(rows, 1):
+        row['rank'] = rank
+
+    with open(os.path.join(sweep_dir, 'leaderboard.json'), 'w') as f:
+        json.dump(rows, f, indent=2)
+    if rows:
+        fields = ['rank', 'trial', 'status', 'val_accuracy', 'epochs', 'wall_clock_s', 'params',
+                  'size_mb', 'pareto', *SEARCH_SPACE]
+        with open(os.path.join(sweep_dir, 'leaderboard.csv'), 'w', newline='') as f:
+            writer = csv.DictWriter(f, fieldnames=fields, extrasaction='ignore')
+            writer.writeheader()
+            writer.writerows(rows)
+    return rows
+
+
+def parse_param(text):
+    name, _, values = text.partition('=')
+    if name not in SEARCH_SPACE or not values:
+        raise argparse.ArgumentTypeError(f"expected one of {', '.join(SEARCH_SPACE)} as name=v1,v2")
+    cast = type(SEARCH_SPACE[name][0])
+    return name, [cast(v) for v in values.split(',')]
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description='Run a parallel hyperparameter sweep')
+    parser.add_argument('--search', choices=['grid', 'random'], default='random')
+    parser.add_argument('--trials', type=int, default=None,
+                        help='Number of trials (random: default 10; grid: default the full grid)')
+    parser.add_argument('--workers', type=int, default=2, help='Trial processes to run at once')
+    parser.add_argument('--epochs', type=int, default=EPOCHS, help='Maximum epochs per trial')
+    parser.add_argument('--param', type=parse_param, action='append', default=[],
+                        metavar='NAME=V1,V2', help='Restrict a hyperparameter to these values')
+    parser.add_argument('--seed', type=int, default=42, help='Seed for random search')
+    return parser.parse_args()
+
+
+def main():
+    args = parse_args()
+    space = {**SEARCH_SPACE, **dict(args.param)}
+    trials = make_trials(args.search, space, args.trials, args.seed)
+
+    build_cache()
+
+    sweep_dir = os.path.join(SWEEP_DIR, datetime.now().strftime('%Y%m%d-%H%M%S'))
+    os.makedirs(sweep_dir, exist_ok=True)
+    print(f"\n🔬 Running {len(trials)} trials ({args.search} search) on {args.workers} workers")
+    print(f"📁 Results in {sweep_dir}/")
+
+    rows = []
+    start = time.time()
+    # JAX is not fork-safe, so trial processes are spawned fresh
+    context = multiprocessing.get_context('spawn')
+    with context.Manager() as manager, \
+            ProcessPoolExecutor(max_workers=args.workers, mp_context=context) as pool:
+        progress = manager.dict()
+        futures = {
+            pool.submit(run_trial, trial_id, params, CACHE_DIR, args.epochs, progress): (trial_id, params)
+            for trial_id, params in enumerate(trials)
+        }
+        with open(os.path.join(sweep_dir, 'trials.jsonl'), 'a') as log:
+            for future in as_completed(futures):
+                trial_id, params = futures[future]
+                try:
+                    row = future.result()
+                except Exception as e:
+                    print(f"❌ Trial {trial_id} failed: {e}")
+                    row = {'trial': trial_id, 'status': 'failed', 'error': str(e), **params}
+                log.write(json.dumps(row) + '\n')
+                log.flush()
+                if row['status'] != 'failed':
+                    rows.append(row)
+                    print(f"{'✂️ ' if row['status'] == 'pruned' else '✅'} Trial {trial_id}: "
+                          f"{row['val_accuracy'] * 100:.2f}% after {row['epochs']} epochs "
+                          f"in {row['wall_clock_s']:.0f}s  {params}")
+
+    rows = write_leaderboard(rows, sweep_dir)
+
+    print("\n" + "="*70)
+    print(f"LEADERBOARD ({time.time() - start:.0f}s total)")
+    print("="*70)
+    print(f"{'Rank':>4} {'Trial':>5} {'Status':<9} {'Accuracy':>9} {'Epochs':>6} {'Time s':>7} "
+          f"{'Size MB':>8}  Pareto  Params")
+    for row in rows:
+        params = ', '.join(f'{name}={row[name]}' for name in SEARCH_SPACE)
+        print(f"{row['rank']:>4} {row['trial']:>5} {row['status']:<9} {row['val_accuracy'] * 100:>8.2f}% "
+              f"{row['epochs']:>6} {row['wall_clock_s']:>7.0f} {row['size_mb']:>8.2f}  "
+              f"{'  *   ' if row['pareto'] else '      '}  {params}")
+    print(f"\n✅ Leaderboard saved to {sweep_dir}/leaderboard.csv")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,215 @@
+# training_state.py
+"""
+Checkpoints, resume and incremental fine-tuning for the training scripts
+A checkpoint is the full model in Keras format (weights + optimizer state,
+including the current learning rate) plus state.json with the epoch, Python /
+NumPy RNG state and the early stopping / LR schedule counters. Files are
+written under new names and state.json is swapped in last, so a crash
+mid-save leaves the previous checkpoint usable.
+
+Fine-tuning compares the training set with the training_manifest.json stored
+next to the production model in the registry (content hash -> label of every
+sample that version was trained on) and retrains only on new or relabelled
+samples plus a small replay of old ones.
+"""
+
+import hashlib
+import json
+import os
+import random
+
+import numpy as np
+import keras
+
+import model_registry
+
+CHECKPOINT_DIR = 'checkpoints'
+STATE_FILENAME = 'state.json'
+MANIFEST_FILENAME = 'training_manifest.json'
+
+FINETUNE_EPOCHS = 5
+FINETUNE_LEARNING_RATE = 1e-4
+# Old samples mixed into each fine-tune, as a fraction of the delta, so the
+# model does not forget what it already learned
+REPLAY_RATIO = 1.0
+
+# Callback counters carried across a resume (EarlyStopping, ReduceLROnPlateau)
+CALLBACK_ATTRIBUTES = ('wait', 'best', 'best_epoch', 'stopped_epoch', 'cooldown_counter')
+
+
+def checkpoint_dir(name):
+    return os.path.join(CHECKPOINT_DIR, name)
+
+
+def _rng_state():
+    name, keys, pos, has_gauss, cached_gaussian = np.random.get_state()
+    version, internal, gauss_next = random.getstate()
+    return {
+        'numpy': [name, keys.tolist(), pos, has_gauss, cached_gaussian],
+        'python': [version, list(internal), gauss_next]
+    }
+
+
+def restore_rng(state):
+    """Restore the Python and NumPy RNG state saved with a checkpoint"""
+    name, keys, pos, has_gauss, cached_gaussian = state['rng']['numpy']
+    np.random.set_state((name, np.array(keys, dtype=np.uint32), pos, has_gauss, cached_gaussian))
+    version, internal, gauss_next = state['rng']['python']
+    random.setstate((version, tuple(internal), gauss_next))
+
+
+class CheckpointCallback(keras.callbacks.Callback):
+    """Save a resumable checkpoint every `every` epochs
+
+    Put it after the callbacks in `callbacks` in the fit() callback list:
+    when resuming, it restores their counters in on_train_begin, after they
+    have reset themselves.
+    """
+
+    def __init__(self, directory, every=1, callbacks=(), resume_state=None, extra_state=None):
+        super().__init__()
+        self.directory = directory
+        self.every = max(1, every)
+        self.callbacks = list(callbacks)
+        self.resume_state = resume_state
+        self.extra_state = extra_state or {}
+
+    def on_train_begin(self, logs=None):
+        if not self.resume_state:
+            return
+        for callback, saved in zip(self.callbacks, self.resume_state.get('callbacks', [])):
+            for attribute, value in saved.items():
+                setattr(callback, attribute, value)
+
+        best_weights = self.resume_state.get('best_weights')
+        if best_weights:
+            with np.load(os.path.join(self.directory, best_weights)) as data:
+                weights = [data[f'arr_{i}'] for i in range(len(data.files))]
+            for callback in self.callbacks:
+                if hasattr(callback, 'best_weights'):
+                    callback.best_weights = weights
+        print(f"♻️  Resumed from checkpoint at epoch {self.resume_state['epoch']}")
+
+    def on_epoch_end(self, epoch, logs=None):
+        if (epoch + 1) % self.every == 0:
+            self.save(epoch + 1)
+
+    def save(self, epoch):
+        os.makedirs(self.directory, exist_ok=True)
+        model_file = f'epoch-{epoch:04d}.keras'
+        self.model.save(os.path.join(self.directory, model_file))
+
+        state = {
+            'epoch': epoch,
+            'model': model_file,
+            'rng': _rng_state(),
+            'callbacks': [
+                {
+                    attribute: float(getattr(callback, attribute))
+                    if isinstance(getattr(callback, attribute), (float, np.floating))
+                    else getattr(callback, attribute)
+                    for attribute in CALLBACK_ATTRIBUTES
+                    if hasattr(callback, attribute)
+                }
+                for callback in self.callbacks
+            ],
+            'best_weights': None,
+            **self.extra_state
+        }
+
+        # EarlyStopping(restore_best_weights=True) keeps the best weights in
+        # memory; save them so a resumed run can still roll back to them
+        for callback in self.callbacks:
+            if getattr(callback, 'best_weights', None) is not None:
+                state['best_weights'] = f'best-{epoch:04d}.npz'
+                np.savez(os.path.join(self.directory, state['best_weights']), *callback.best_weights)
+                break
+
+        state_path = os.path.join(self.directory, STATE_FILENAME)
+        with open(f'{state_path}.tmp', 'w') as f:
+            json.dump(state, f)
+        os.replace(f'{state_path}.tmp', state_path)
+
+        # Drop files from earlier checkpoints now the new one is in place
+        for name in os.listdir(self.directory):
+            if name not in (STATE_FILENAME, model_file, state['best_weights']):
+                os.remove(os.path.join(self.directory, name))
+
+
+def load_checkpoint(directory):
+    """Return (model, state) for the latest checkpoint, or (None, None) if there is none"""
+    try:
+        with open(os.path.join(directory, STATE_FILENAME)) as f:
+            state = json.load(f)
+    except FileNotFoundError:
+        return None, None
+    model = keras.models.load_model(os.path.join(directory, state['model']))
+    return model, state
+
+
+def clear_checkpoint(directory):
+    """Remove a finished run's checkpoint so the next run starts fresh"""
+    if os.path.isdir(directory):
+        for name in os.listdir(directory):
+            os.remove(os.path.join(directory, name))
+        os.rmdir(directory)
+
+
+def sample_keys(X):
+    """Content hash of each image (quantised to 8-bit pixels, as stored on disk)"""
+    pixels = np.round(np.asarray(X) * 255).astype(np.uint8)
+    return [hashlib.sha1(image.tobytes()).hexdigest() for image in pixels]
+
+
+def validation_mask(keys, fraction=0.2):
+    """True for samples in the validation split, decided by each sample's own hash
+
+    Unlike a shuffled split, appending rows never moves an existing sample
+    between training and validation, so a fine-tune's delta is only the new
+    rows and old training samples never leak into validation.
+    """
+    return np.array([int(key[:8], 16) < fraction * 2 ** 32 for key in keys], dtype=bool)
+
+
+def load_manifest(version):
+    """Samples a registry version was trained on: {content hash: label index}
+
+    Empty for the legacy model and for versions registered without a manifest,
+    so every sample counts as new.
+    """
+    if version == model_registry.LEGACY_VERSION:
+        return {}
+    path = os.path.join(model_registry.REGISTRY_DIR, version, MANIFEST_FILENAME)
+    try:
+        with open(path) as f:
+            return json.load(f)['samples']
+    except FileNotFoundError:
+        return {}
+
+
+def manifest_files(keys, labels):
+    """extra_files entry for register_model recording the samples a model saw"""
+    samples = {key: int(label) for key, label in zip(keys, labels)}
+    return {MANIFEST_FILENAME: {'samples': samples}}
+
+
+def select_delta(keys, labels, manifest, replay_ratio=REPLAY_RATIO, seed=42):
+    """Indices of new / relabelled samples, and of old samples to replay alongside them"""
+    delta = [i for i, (key, label) in enumerate(zip(keys, labels)) if manifest.get(key) != int(label)]
+    delta_set = set(delta)
+    old = [i for i in range(len(keys)) if i not in delta_set]
+
+    n_replay = min(len(old), int(round(len(delta) * replay_ratio)))
+    replay = sorted(np.random.default_rng(seed).choice(old, n_replay, replace=False).tolist()) if n_replay else []
+    return delta, replay
+
+
+def production_version():
+    """Version of the model currently being served"""
+    return model_registry.get_active_version() or model_registry.LEGACY_VERSION
+
+
+def load_production_model(version=None):
+    """Return (model, version) for a version, by default the one currently being served"""
+    version = version or production_version()
+    return keras.models.load_model(model_registry.model_path(version)), version
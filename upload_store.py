@@ -0,0 +1,214 @@
+# upload_store.py
+"""
+Content-addressed storage for uploaded images
+Files are named by their SHA-256 digest and sharded into two levels of
+subdirectories (ab/cd/abcd....jpg), so identical uploads are stored once and
+no directory grows large. A background thread evicts files by age and total
+size to keep disk use bounded.
+"""
+
+import hashlib
+import os
+import tempfile
+import threading
+import time
+from dataclasses import dataclass
+
+from PIL import Image, ImageOps
+
+HASH_CHUNK_SIZE = 1024 * 1024
+THUMBNAIL_DIR = 'thumbs'
+TMP_DIR = '.tmp'
+
+
+@dataclass
+class StoredUpload:
+    """An upload saved in the store"""
+    digest: str
+    path: str       # Filesystem path of the original
+    name: str       # Path relative to the store root, recorded in the database
+    url: str        # URL the UI should display (thumbnail when enabled)
+
+
+def _is_shard(name):
+    return len(name) == 2 and all(c in '0123456789abcdef' for c in name)
+
+
+class UploadStore:
+    """Deduplicating upload store with thumbnails and retention quotas"""
+
+    def __init__(self, root, url_prefix, max_bytes=None, max_age_seconds=None,
+                 thumbnail_size=256, eviction_interval=600):
+        self.root = root
+        self.url_prefix = url_prefix.rstrip('/')
+        self.max_bytes = max_bytes
+        self.max_age_seconds = max_age_seconds
+        self.thumbnail_size = thumbnail_size
+        self.eviction_interval = eviction_interval
+        self._eviction_thread = None
+        self._lock = threading.Lock()
+
+    def _shard_path(self, base, digest, extension):
+        return os.path.join(base, digest[:2], digest[2:4], f'{digest}.{extension}')
+
+    def save(self, stream, original_filename):
+        """Hash and store an uploaded file stream, reusing an identical stored copy"""
+        self.start_eviction()
+
+        extension = original_filename.rsplit('.', 1)[-1].lower() if '.' in original_filename else 'bin'
+        if extension == 'jpeg':
+            extension = 'jpg'
+
+        tmp_dir = os.path.join(self.root, TMP_DIR)
+        os.makedirs(tmp_dir, exist_ok=True)
+
+        # Hash while copying so the upload is read only once
+        sha256 = hashlib.sha256()
+        fd, tmp_path = tempfile.mkstemp(dir=tmp_dir)
+        try:
+            with os.fdopen(fd, 'wb') as out:
+                while True:
+                    chunk = stream.read(HASH_CHUNK_SIZE)
+                    if not chunk:
+                        break
+                    sha256.update(chunk)
+                    out.write(chunk)
+
+            digest = sha256.hexdigest()
+            path = self._shard_path(self.root, digest, extension)
+            try:
+                # Duplicate: refresh its age so retention treats it as recent
+                os.utime(path)
+            except FileNotFoundError:
+                # New, or evicted in the meantime: store this copy
+                os.makedirs(os.path.dirname(path), exist_ok=True)
+                os.replace(tmp_path, path)
+        finally:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+
+        name = os.path.relpath(path, self.root).replace(os.sep, '/')
+        return StoredUpload(digest=digest, path=path, name=name, url=f'{self.url_prefix}/{name}')
+
+    def thumbnail_url(self, stored):
+        """Return a URL for a downscaled copy of an upload, creating it if needed
+
+        Falls back to the original's URL when thumbnails are disabled or the
+        image cannot be thumbnailed.
+        """
+        if not self.thumbnail_size:
+            return stored.url
+
+        thumb_path = self._shard_path(os.path.join(self.root, THUMBNAIL_DIR), stored.digest, 'jpg')
+        try:
+            os.utime(thumb_path)
+        except FileNotFoundError:
+            tmp_dir = os.path.join(self.root, TMP_DIR)
+            tmp_path = None
+            try:
+                os.makedirs(os.path.dirname(thumb_path), exist_ok=True)
+                os.makedirs(tmp_dir, exist_ok=True)
+                with Image.open(stored.path) as img:
+                    img.draft('RGB', (self.thumbnail_size, self.thumbnail_size))
+                    img = ImageOps.exif_transpose(img).convert('RGB')
+                    img.thumbnail((self.thumbnail_size, self.thumbnail_size))
+                    # Unique across threads and worker processes
+                    fd, tmp_path = tempfile.mkstemp(dir=tmp_dir)
+                    with os.fdopen(fd, 'wb') as out:
+                        img.save(out, 'JPEG', quality=85)
+                os.replace(tmp_path, thumb_path)
+            except Exception as e:
+                print(f"Thumbnail error: {e}")
+                if tmp_path is not None and os.path.exists(tmp_path):
+                    os.remove(tmp_path)
+                return stored.url
+
+        name = os.path.relpath(thumb_path, self.root).replace(os.sep, '/')
+        return f'{self.url_prefix}/{name}'
+
+    def _iter_files(self, base):
+        """Yield DirEntry objects for every stored file under a sharded base directory"""
+        if not os.path.isdir(base):
+            return
+        for first in os.scandir(base):
+            if not (first.is_dir() and _is_shard(first.name)):
+                continue
+            for second in os.scandir(first.path):
+                if not (second.is_dir() and _is_shard(second.name)):
+                    continue
+                for entry in os.scandir(second.path):
+                    if entry.is_file() and not entry.name.endswith('.tmp'):
+                        yield entry
+
+    def evict(self):
+        """Delete files past the age quota, then the oldest until under the size quota
+
+        Thumbnails are counted and evicted the same way as originals.
+        Returns (files_removed, bytes_removed).
+        """
+        with self._lock:
+            now = time.time()
+            files = []
+            for base in (self.root, os.path.join(self.root, THUMBNAIL_DIR)):
+                for entry in self._iter_files(base):
+                    try:
+                        stat = entry.stat()
+                    except FileNotFoundError:
+                        continue
+                    files.append((stat.st_mtime, stat.st_size, entry.path))
+
+            files.sort()
+            total = sum(size for _, size, _ in files)
+            removed = removed_bytes = 0
+
+            for mtime, size, path in files:
+                too_old = self.max_age_seconds is not None and now - mtime > self.max_age_seconds
+                too_big = self.max_bytes is not None and total > self.max_bytes
+                if not (too_old or too_big):
+                    break
+                try:
+                    # save() refreshes duplicates without the lock; keep any
+                    # file re-uploaded since the scan
+                    if os.stat(path).st_mtime != mtime:
+                        continue
+                    os.remove(path)
+                except FileNotFoundError:
+                    pass
+                total -= size
+                removed += 1
+                removed_bytes += size
+
+            # Clear out temp files left behind by crashed writers
+            tmp_dir = os.path.join(self.root, TMP_DIR)
+            if os.path.isdir(tmp_dir):
+                for entry in os.scandir(tmp_dir):
+                    try:
+                        if now - entry.stat().st_mtime > 3600:
+                            os.remove(entry.path)
+                    except FileNotFoundError:
+                        pass
+
+            return removed, removed_bytes
+
+    def _eviction_loop(self):
+        while True:
+            try:
+                removed, removed_bytes = self.evict()
+                if removed:
+                    print(f"🧹 Evicted {removed} uploads ({removed_bytes / 1024 / 1024:.1f} MB)")
+            except Exception as e:
+                print(f"Upload eviction error: {e}")
+            time.sleep(self.eviction_interval)
+
+    def start_eviction(self):
+        """Start the background eviction thread once per process"""
+        if self._eviction_thread is not None or not self.eviction_interval:
+            return
+        if self.max_bytes is None and self.max_age_seconds is None:
+            return
+        with self._lock:
+            if self._eviction_thread is None:
+                self._eviction_thread = threading.Thread(
+                    target=self._eviction_loop, name='upload-eviction', daemon=True
+                )
+                self._eviction_thread.start()
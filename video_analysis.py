@@ -0,0 +1,171 @@
+# video_analysis.py
+"""
+Frame sources and temporal smoothing for video emotion analysis
+Frames are produced lazily so only one inference batch is held in memory,
+however long the video is
+"""
+
+import io
+
+import cv2
+import numpy as np
+
+from image_decode import decode_grayscale
+
+VIDEO_EXTENSIONS = {'mp4', 'avi', 'mov', 'mkv', 'webm'}
+
+
+def sampling_step(source_fps, every_n=None, target_fps=None):
+    """Work out how many source frames to advance per sampled frame"""
+    if target_fps and source_fps:
+        return max(1, int(round(source_fps / target_fps)))
+    return max(1, int(every_n or 1))
+
+
+def open_video(path):
+    """Open a video file for decoding; raises ValueError if OpenCV cannot read it"""
+    capture = cv2.VideoCapture(path)
+    if not capture.isOpened():
+        capture.release()
+        raise ValueError('Could not open video')
+    return capture
+
+
+def iter_video_frames(capture, max_dim, every_n=None, target_fps=None, max_frames=None):
+    """Yield (frame_index, time_seconds, gray, scale) for sampled frames of an opened video
+
+    Frames are downscaled to no more than max_dim pixels so a batch stays small
+    whatever the source resolution; scale maps them back to original
+    coordinates. The capture is released when the iterator finishes.
+    """
+    try:
+        source_fps = capture.get(cv2.CAP_PROP_FPS) or None
+        step = sampling_step(source_fps, every_n, target_fps)
+
+        index = 0
+        sampled = 0
+        while max_frames is None or sampled < max_frames:
+            # grab() skips decoding frames that are not sampled
+            if not capture.grab():
+                break
+            if index % step == 0:
+                ok, frame = capture.retrieve()
+                if not ok:
+                    break
+                gray = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)
+                height, width = gray.shape[:2]
+                scale = 1.0
+                if max(height, width) > max_dim:
+                    scale = max(height, width) / float(max_dim)
+                    gray = cv2.resize(gray, (int(width / scale), int(height / scale)),
+                                      interpolation=cv2.INTER_AREA)
+                timestamp = index / source_fps if source_fps else None
+                yield index, timestamp, gray, scale
+                sampled += 1
+            index += 1
+    finally:
+        capture.release()
+
+
+def iter_image_frames(encoded_frames, max_dim, every_n=None, target_fps=None, max_frames=None):
+    """Yield (frame_index, time_seconds, gray, scale) for a sequence of encoded frame images
+
+    target_fps is taken as the frame rate of the uploaded sequence and is only
+    used to timestamp frames. Each frame is decoded only when it is reached, at
+    no more than max_dim pixels; scale maps it back to original coordinates.
+    """
+    step = max(1, int(every_n or 1))
+    sampled = 0
+    for index, data in enumerate(encoded_frames):
+        if max_frames is not None and sampled >= max_frames:
+            break
+        if index % step:
+            continue
+        gray, scale = decode_grayscale(io.BytesIO(data), max_dim)
+        timestamp = index / target_fps if target_fps else None
+        yield index, timestamp, gray, scale
+        sampled += 1
+
+
+def iter_batches(frames, batch_size):
+    """Group a frame iterator into lists of at most batch_size frames"""
+    batch = []
+    for frame in frames:
+        batch.append(frame)
+        if len(batch) == batch_size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+class EmotionTimeline:
+    """Exponentially smoothed emotion probabilities and the segments they form
+
+    Only the running average, the open segment and per-emotion frame counts are
+    kept, so memory does not grow with the number of frames.
+    """
+
+    def __init__(self, emotions, alpha=0.3):
+        self.emotions = emotions
+        self.alpha = alpha
+        self.smoothed = None
+        self.segment = None
+        self.segment_count = 0
+        self.frame_count = 0
+        self.counts = np.zeros(len(emotions), dtype=np.int64)
+        self.confidence_sum = np.zeros(len(emotions))
+
+    def update(self, frame_index, timestamp, probabilities):
+        """Add one frame; returns (smoothed_probabilities, closed_segment_or_None)"""
+        probabilities = np.asarray(probabilities, dtype='float64')
+        if self.smoothed is None:
+            self.smoothed = probabilities
+        else:
+            self.smoothed = self.alpha * probabilities + (1 - self.alpha) * self.smoothed
+
+        emotion_idx = int(np.argmax(self.smoothed))
+        self.counts[emotion_idx] += 1
+        self.confidence_sum[emotion_idx] += self.smoothed[emotion_idx]
+        self.frame_count += 1
+
+        closed = None
+        if self.segment is not None and self.segment['emotion'] != self.emotions[emotion_idx]:
+            closed = self._close()
+        if self.segment is None:
+            self.segment = {
+                'emotion': self.emotions[emotion_idx],
+                'start_frame': frame_index,
+                'start_time': timestamp,
+                'frames': 0
+            }
+        self.segment['end_frame'] = frame_index
+        self.segment['end_time'] = timestamp
+        self.segment['frames'] += 1
+
+        return self.smoothed, closed
+
+    def finish(self):
+        """Close the open segment; returns (last_segment_or_None, summary)"""
+        closed = self._close() if self.segment is not None else None
+        summary = {
+            'frames_analyzed': self.frame_count,
+            'segments': self.segment_count,
+            'emotion_frames': {
+                emotion: int(count)
+                for emotion, count in zip(self.emotions, self.counts)
+            }
+        }
+        if self.frame_count:
+            dominant_idx = int(np.argmax(self.counts))
+            summary['dominant_emotion'] = self.emotions[dominant_idx]
+            summary['dominant_confidence'] = float(
+                self.confidence_sum[dominant_idx] / self.counts[dominant_idx]
+            ) * 100
+        return closed, summary
+
+    def _close(self):
+        segment = self.segment
+        self.segment = None
+        self.segment_count += 1
+        return segment